@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import importlib.util
 import os
+import tempfile
 from pathlib import Path
+
+import django
 from .logging_config import LOGGING
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,8 +50,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+  # First, so request latency covers the other middleware too
+  "files.metrics.metrics_middleware",
   "django.middleware.security.SecurityMiddleware",
-  "whitenoise.middleware.WhiteNoiseMiddleware",
+  # WhiteNoise, async-capable so async views are not run on a thread because of it
+  "core.middleware.WhiteNoiseMiddleware",
   "django.contrib.sessions.middleware.SessionMiddleware",
   "corsheaders.middleware.CorsMiddleware",
   "django.middleware.common.CommonMiddleware",
@@ -85,9 +92,60 @@ DATABASES = {
   "default": {
     "ENGINE": "django.db.backends.sqlite3",
     "NAME": os.path.join(BASE_DIR, 'data', 'db.sqlite3'),
+    "OPTIONS": {
+      # Wait for concurrent writers instead of failing with "database is locked"
+      "timeout": 20,
+    },
+    # Tests use an on-disk database: threads sharing Django's in-memory test
+    # database fail with "table is locked" instead of waiting for the writer
+    "TEST": {
+      "NAME": os.path.join(tempfile.gettempdir(), 'filehub-test.sqlite3'),
+    },
   }
 }
 
+if django.VERSION >= (5, 1):
+  # Take the write lock when a transaction starts; a deferred transaction that
+  # reads and then writes (as reference counting does) can deadlock and fail
+  # immediately instead of waiting for the lock
+  DATABASES["default"]["OPTIONS"]["transaction_mode"] = "IMMEDIATE"
+
+# PRAGMAs set on every SQLite connection, over files.sqlite.DEFAULTS (WAL,
+# synchronous=NORMAL, 256 MiB mmap, 64 MiB cache, 20 s busy timeout); None
+# keeps SQLite's default. Compare settings with `manage.py bench_sqlite`
+FILES_SQLITE_PRAGMAS = {
+  # WAL needs shared memory, so use 'delete' for databases on network filesystems
+  'journal_mode': os.environ.get('FILES_SQLITE_JOURNAL_MODE', 'wal'),
+  'synchronous': os.environ.get('FILES_SQLITE_SYNCHRONOUS', 'normal'),
+}
+
+# DJANGO_DATABASE=postgresql switches to PostgreSQL, which allows concurrent
+# writers; connection details use the official postgres image's variable names
+if os.environ.get('DJANGO_DATABASE', 'sqlite') == 'postgresql':
+  DATABASES = {
+    "default": {
+      "ENGINE": "django.db.backends.postgresql",
+      "NAME": os.environ.get('POSTGRES_DB', 'filehub'),
+      "USER": os.environ.get('POSTGRES_USER', 'filehub'),
+      "PASSWORD": os.environ.get('POSTGRES_PASSWORD', ''),
+      "HOST": os.environ.get('POSTGRES_HOST', 'localhost'),
+      "PORT": os.environ.get('POSTGRES_PORT', '5432'),
+      # Reuse connections across requests rather than reconnecting every time
+      "CONN_MAX_AGE": int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 60)),
+      "CONN_HEALTH_CHECKS": True,
+      "OPTIONS": {},
+    }
+  }
+  if (django.VERSION >= (5, 1) and os.environ.get('DJANGO_DB_POOL', 'True') == 'True'
+      and importlib.util.find_spec('psycopg_pool')):
+    # A psycopg pool per process replaces persistent connections (Django requires CONN_MAX_AGE=0)
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+      "min_size": int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', 2)),
+      "max_size": int(os.environ.get('DJANGO_DB_POOL_MAX_SIZE', 10)),
+      "timeout": int(os.environ.get('DJANGO_DB_POOL_TIMEOUT', 10)),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,12 +183,98 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are hashed while they stream in; large ones are staged next to
+# MEDIA_ROOT so storing them is a rename rather than a second copy
+FILE_UPLOAD_HANDLERS = [
+    'files.upload_handlers.HashingMemoryFileUploadHandler',
+    'files.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+FILE_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, '.staging')
+# SHA-256 read sizes for files on disk/in memory and for streaming uploads;
+# compare settings on the target machine with `manage.py bench_hash`
+FILES_HASHING = {
+    'CHUNK_SIZE': int(os.environ.get('FILES_HASH_CHUNK_SIZE', 1024 * 1024)),
+    'UPLOAD_CHUNK_SIZE': int(os.environ.get('FILES_UPLOAD_CHUNK_SIZE', 256 * 1024)),
+}
+# POST /api/files/batch/ takes a whole folder at once
+DATA_UPLOAD_MAX_NUMBER_FILES = int(os.environ.get('DATA_UPLOAD_MAX_NUMBER_FILES', 1000))
+
+# Optional sub-file dedup: new uploads of at least MIN_FILE_SIZE bytes are split
+# with FastCDC into ~AVG_SIZE chunks stored once each (needs the fastcdc package)
+FILES_CHUNKING = {
+    'ENABLED': os.environ.get('FILES_CHUNKING', 'False') == 'True',
+    'MIN_FILE_SIZE': int(os.environ.get('FILES_CHUNKING_MIN_FILE_SIZE', 1024 * 1024)),
+    'AVG_SIZE': int(os.environ.get('FILES_CHUNK_AVG_SIZE', 64 * 1024)),
+}
+
+# Compression at rest, off by default: new blobs are stored with CODEC ('gzip',
+# 'zstd' with the zstandard package, or '' for off) unless their type is already
+# compressed; TYPES maps file type patterns to {'codec': ..., 'level': ...} or
+# None (raw). A Range request into a compressed blob decodes everything before it
+FILES_COMPRESSION = {
+    'CODEC': os.environ.get('FILES_COMPRESSION_CODEC', ''),
+    'LEVEL': int(os.environ.get('FILES_COMPRESSION_LEVEL', 6)),
+    'TYPES': {},
+}
+
+# Per-process Bloom filter of stored hashes: uploads of content it has never seen
+# skip the dedup query. Sized for CAPACITY hashes at ERROR_RATE false positives,
+# never more than MAX_BYTES; other workers' uploads are picked up every
+# REFRESH_INTERVAL seconds
+FILES_HASH_FILTER = {
+    'ENABLED': os.environ.get('FILES_HASH_FILTER', 'True') == 'True',
+    'CAPACITY': int(os.environ.get('FILES_HASH_FILTER_CAPACITY', 1000000)),
+    'MAX_BYTES': int(os.environ.get('FILES_HASH_FILTER_MAX_BYTES', 16 * 1024 * 1024)),
+}
+
+# Prometheus metrics at /metrics, readable from the ALLOW_FROM networks only.
+# FILES_SERVER_TIMING=True adds a Server-Timing header with each request's phases
+# (db, hash, compress, storage). With several worker processes, also set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory
+FILES_METRICS = {
+    'SERVER_TIMING': os.environ.get('FILES_SERVER_TIMING', 'False') == 'True',
+    'ALLOW_FROM': os.environ.get('FILES_METRICS_ALLOW_FROM', '127.0.0.0/8,::1/128').split(','),
+}
+
+# Downloads are streamed by Django unless a fronting proxy serves them:
+# 'nginx' (X-Accel-Redirect to FILES_SENDFILE_URL_PREFIX, an internal location
+# aliased to MEDIA_ROOT) or 'apache' (X-Sendfile with the absolute path)
+FILES_SENDFILE_BACKEND = os.environ.get('FILES_SENDFILE_BACKEND') or None
+FILES_SENDFILE_URL_PREFIX = os.environ.get('FILES_SENDFILE_URL_PREFIX', '/protected-media/')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+    # File blobs are stored once per SHA-256 under cas/ab/cd/<hash>
+    'blobs': {
+        'BACKEND': 'files.storage.ContentAddressedStorage',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # File list/detail responses. File-based, so every worker process on the host
+    # shares the entries and sees the same invalidations without a cache server
+    'files': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('FILES_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'filehub-cache')),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+FILES_CACHE_ALIAS = 'files'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -151,7 +295,8 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Keyset pagination: constant cost per page and no COUNT(*) on the file table
+    'DEFAULT_PAGINATION_CLASS': 'files.pagination.FileCursorPagination',
     'PAGE_SIZE': 10
 }
 
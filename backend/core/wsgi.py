@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_wsgi_application()
+
+# Each worker process builds its dedup hash filter before serving requests
+from files.hash_filter import warm_hash_filter  # noqa: E402
+
+warm_hash_filter()
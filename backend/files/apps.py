@@ -1,6 +1,50 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
 
 
 class FilesConfig(AppConfig):
   default_auto_field = "django.db.models.BigAutoField"
   name = "files"
+
+  def ready(self):
+    # Uploads are staged here before being renamed into storage
+    if settings.FILE_UPLOAD_TEMP_DIR:
+      os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+    post_migrate.connect(repair_search_index, sender=self)
+    from .sqlite import configure_connection
+    connection_created.connect(configure_connection, dispatch_uid='files_sqlite_pragmas')
+    # Query counts and time per request for the metrics middleware
+    from .metrics import instrument_connection
+    connection_created.connect(instrument_connection, dispatch_uid='files_metrics_queries')
+    # save() and delete() paths (serializer creates, row deletes) invalidate cached
+    # responses here; set-based updates call invalidate_files() themselves
+    from .cache import file_saved_or_deleted
+    File = self.get_model('File')
+    post_save.connect(file_saved_or_deleted, sender=File, dispatch_uid='files_cache_save')
+    post_delete.connect(file_saved_or_deleted, sender=File, dispatch_uid='files_cache_delete')
+    # The same paths keep the per-type storage totals current
+    from .stats import file_deleted, file_saved, file_will_save
+    pre_save.connect(file_will_save, sender=File, dispatch_uid='files_stats_pre_save')
+    post_save.connect(file_saved, sender=File, dispatch_uid='files_stats_save')
+    post_delete.connect(file_deleted, sender=File, dispatch_uid='files_stats_delete')
+    # Deleting a chunked file releases its chunks, whichever path deletes it
+    from .chunking import file_will_delete
+    pre_delete.connect(file_will_delete, sender=File, dispatch_uid='files_chunks_delete')
+    # Stored hashes go into this process's dedup lookup filter as they are saved
+    from . import hash_filter
+    post_save.connect(hash_filter.file_saved, sender=File, dispatch_uid='files_hash_filter_save')
+    post_delete.connect(hash_filter.file_deleted, sender=File, dispatch_uid='files_hash_filter_delete')
+
+
+def repair_search_index(using, **kwargs):
+  """Reinstall search triggers if a migration remade files_file and dropped them"""
+  from django.db.migrations.recorder import MigrationRecorder
+  from .search import install_search_index
+  connection = connections[using]
+  if ('files', '0008_file_search_index') in MigrationRecorder(connection).applied_migrations():
+    install_search_index(connection)
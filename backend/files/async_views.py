@@ -0,0 +1,144 @@
+"""Async versions of the file list, retrieve, upload and download endpoints.
+
+Served under ``/api/async/`` for ASGI deployments (``uvicorn core.asgi:application``).
+Database reads use the async ORM and downloads stream through an async
+iterator, so a slow client ties up a coroutine rather than a worker thread.
+Responses are identical to the DRF endpoints in views.py, including the
+response cache and ETag revalidation of listings and details.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .downloads import build_download_response
+from .models import File
+from .serializers import FileListSerializer, FileSerializer
+from .cache import get_cache
+from .services import ingest_upload
+from .utils import get_upload_hash
+from .views import FileViewSet
+
+logger = logging.getLogger(__name__)
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+def _viewset(request, action):
+    """A FileViewSet bound to this request, for its filters, paginator and serializer context"""
+    return FileViewSet(request=Request(request), format_kwarg=None, action=action, args=(), kwargs={})
+
+
+async def _cached(view, scope, build):
+    """CachedResponseMixin.cached_response for async views; ``build`` returns ``(data, status)``"""
+    request = view.request._request
+    # Reading the generation goes to the file-based cache, so it runs on a thread
+    key, etag = await sync_to_async(view.cache_key_and_etag)(view.request, scope)
+    response = view.not_modified(request, etag)
+    if response is None:
+        cache = get_cache()
+        data, status_code = await cache.aget(key), status.HTTP_200_OK
+        if data is None:
+            data, status_code = await build()
+            if status_code == status.HTTP_200_OK:
+                await cache.aset(key, data)
+        response = _json(data, status_code)
+    return view.add_validators(response, etag)
+
+
+async def _get_file(pk):
+    try:
+        return await File.objects.select_related('original_file').aget(pk=pk)
+    except File.DoesNotExist:
+        return None
+
+
+async def _list(request):
+    view = _viewset(request, 'list')
+    logger.info(f"Received filter parameters: {view.request.query_params}")
+    # Pagination links point at this endpoint, so entries are not shared with /api/files/
+    return await _cached(view, 'async-list', lambda: _build_list(view))
+
+
+async def _build_list(view):
+    # Building the filtered queryset may look up the search index once per process, so it runs on a thread
+    queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    queryset = queryset.values(*FileListSerializer.values)
+    context = view.get_serializer_context()
+    page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+    if page is None:
+        rows = [row async for row in queryset]
+        return FileListSerializer(rows, context=context).data, status.HTTP_200_OK
+    return view.paginator.get_paginated_response(FileListSerializer(page, context=context).data).data, status.HTTP_200_OK
+
+
+async def _create(request):
+    view = _viewset(request, 'create')
+    # Parsing the multipart body runs the hashing upload handlers, which is blocking work
+    files = await sync_to_async(lambda: request.FILES)()
+    file_obj = files.get('file')
+    if not file_obj:
+        return _json({"error": "No file was submitted"}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        file_hash = await sync_to_async(get_upload_hash)(file_obj)
+        logger.info(f"Computed hash: {file_hash}")
+        # ingest_upload looks for a stored copy first, so duplicates cost one lookup as in views.py
+        instance, created = await sync_to_async(ingest_upload)(
+            file_obj, file_hash, file_obj.name, file_obj.content_type, file_obj.size
+        )
+    except Exception as e:
+        logger.error(f"Error in async create: {str(e)}", exc_info=True)
+        return _json({"error": str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    data, status_code = view.ingest_result(instance, created)
+    return _json(data, status_code)
+
+
+async def file_collection(request):
+    """GET lists files like /api/files/, POST uploads one"""
+    try:
+        if request.method == 'GET':
+            return await _list(request)
+        if request.method == 'POST':
+            return await _create(request)
+    except APIException as e:
+        # Same body DRF's exception handler produces
+        return _json(e.detail if isinstance(e.detail, (list, dict)) else {"detail": e.detail}, e.status_code)
+    return HttpResponseNotAllowed(['GET', 'POST'])
+
+
+async def file_detail(request, pk):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    view = _viewset(request, 'retrieve')
+
+    async def build():
+        instance = await _get_file(pk)
+        if instance is None:
+            return {"detail": "No File matches the given query."}, status.HTTP_404_NOT_FOUND
+        return FileSerializer(instance, context=view.get_serializer_context()).data, status.HTTP_200_OK
+
+    return await _cached(view, f"async-retrieve:{pk}", build)
+
+
+async def file_download(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    instance = await _get_file(pk)
+    if instance is None:
+        return _json({"detail": "No File matches the given query."}, status.HTTP_404_NOT_FOUND)
+    # Opening the blob and reading its size (or a chunked file's manifest) blocks, so it runs
+    # on a thread; the body is then streamed by an async iterator
+    return await sync_to_async(build_download_response)(request, instance, asynchronous=True)
+
+
+# The API is unauthenticated like the DRF views, which are exempt from CSRF as well;
+# set as an attribute because csrf_exempt only wraps coroutines from Django 5.0 on
+file_collection.csrf_exempt = True
@@ -0,0 +1,211 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from .models import File
+from .serializers import FileListSerializer
+
+
+@contextmanager
+def isolated_environment():
+    """Run benchmarks against a throwaway database and media root.
+
+    SQLite gets an on-disk test database rather than Django's default
+    in-memory one, so timings include real file I/O.
+    """
+    workdir = tempfile.mkdtemp(prefix='filehub-bench-')
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+    media_root = os.path.join(workdir, 'media')
+    staging_dir = os.path.join(media_root, '.staging')
+    os.makedirs(staging_dir)
+    try:
+        caches = {**settings.CACHES, settings.FILES_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(workdir, 'cache'),
+        }}
+        with override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_TEMP_DIR=staging_dir, CACHES=caches):
+            yield workdir
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def seed_files(count, reference_ratio=0.0, batch_size=5000, start=0, file_types=('text/plain',)):
+    """Insert ``count`` File rows directly, a share of them references to earlier originals.
+
+    Rows are numbered from ``start`` (so repeated calls can grow a table) and
+    cycle through ``file_types``.
+    """
+    created = 0
+    originals = []
+    while created < count:
+        batch = []
+        for _ in range(min(batch_size, count - created)):
+            index = start + created + len(batch)
+            if originals and (index % 100) < reference_ratio * 100:
+                original = originals[index % len(originals)]
+                batch.append(File(
+                    original_filename=f"copy-of-{original.original_filename}",
+                    file_type=original.file_type,
+                    size=original.size,
+                    hash='',
+                    is_reference=True,
+                    original_file=original,
+                ))
+            else:
+                original = File(
+                    file=f"cas/00/00/{uuid.uuid4().hex}",
+                    original_filename=f"file-{index}.txt",
+                    file_type=file_types[index % len(file_types)],
+                    size=1024 + index,
+                    hash=uuid.uuid4().hex + uuid.uuid4().hex,
+                )
+                batch.append(original)
+                originals.append(original)
+        File.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def parse_distribution(spec):
+    """``'4096:70,65536:30'`` -> ``([4096, 65536], [70.0, 30.0])``: sizes and their weights"""
+    sizes, weights = [], []
+    for part in spec.split(','):
+        size, _, weight = part.partition(':')
+        sizes.append(int(size))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+def upload_plan(count, duplicate_ratio, sizes, weights, seed=0):
+    """A reproducible upload sequence: ``(content_id, size)`` per upload.
+
+    Roughly ``duplicate_ratio`` of the uploads repeat the content of an
+    earlier one; the rest get new content with a size drawn from the
+    distribution. Feed the pairs to synthetic_content for the bytes.
+    """
+    rng = random.Random(seed)
+    plan = []
+    for index in range(count):
+        if plan and rng.random() < duplicate_ratio:
+            plan.append(rng.choice(plan))
+        else:
+            plan.append((index, rng.choices(sizes, weights)[0]))
+    return plan
+
+
+def synthetic_content(content_id, size, seed=0):
+    """Deterministic, incompressible bytes for an upload_plan entry"""
+    return random.Random(f"{seed}-{content_id}").randbytes(size)
+
+
+def time_call(func, repeat):
+    """Run ``func`` ``repeat`` times and return the per-call durations in seconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations):
+    """Latency summary in milliseconds"""
+    ordered = sorted(durations)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def read_write_workload(readers, writers, duration, page_size=50, file_size=4096):
+    """Run list-page readers and uploading writers side by side for ``duration`` seconds.
+
+    Each thread uses its own database connection. Returns per-kind latency
+    summaries plus throughput and the number of failed operations (e.g.
+    "database is locked").
+    """
+    from .services import ingest_upload
+    from .hashing import hash_file
+
+    stop = threading.Event()
+    durations = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def read():
+        rows = File.objects.values(*FileListSerializer.values).order_by('-uploaded_at', '-id')
+        return list(rows[:page_size])
+
+    def write(worker, index):
+        name = f"bench-{worker}-{index}.bin"
+        content = name.encode().ljust(file_size, b'.')
+        upload = SimpleUploadedFile(name, content, 'application/octet-stream')
+        ingest_upload(upload, hash_file(upload), name, upload.content_type, upload.size)
+
+    def run(kind, operation, worker):
+        index = 0
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    operation(worker, index) if kind == 'write' else operation()
+                except OperationalError:
+                    with lock:
+                        errors[kind] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    durations[kind].append(elapsed)
+                index += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=('read', read, n)) for n in range(readers)]
+    threads += [threading.Thread(target=run, args=('write', write, n)) for n in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for kind in ('read', 'write'):
+        results[kind] = {
+            **(summarize(durations[kind]) if durations[kind] else {'count': 0}),
+            'per_second': len(durations[kind]) / elapsed,
+            'errors': errors[kind],
+        }
+    return results
@@ -0,0 +1,58 @@
+"""Response cache for file listings and details, invalidated by a generation token.
+
+Every cached response is keyed on the current generation. Any change to a
+File row replaces the generation once its transaction commits, so entries
+from before the change are simply never read again (and expire on their own).
+The token is a fresh unique value rather than an incremented counter, so two
+concurrent bumps can never collapse into one.
+"""
+import hashlib
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'files:generation'
+
+
+def get_cache():
+    return caches[settings.FILES_CACHE_ALIAS]
+
+
+def _new_generation():
+    return f"{time.time_ns()}-{secrets.token_hex(4)}"
+
+
+def current_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    get_cache().set(GENERATION_KEY, _new_generation(), None)
+
+
+def invalidate_files(using=None):
+    """Invalidate cached file responses once the current transaction commits.
+
+    Bumping only after commit keeps a concurrent reader from caching
+    pre-commit rows under the new generation.
+    """
+    transaction.on_commit(bump_generation, using=using)
+
+
+def response_key(generation, scope, base_url, query_params):
+    """Cache key for a response: generation, endpoint, host and normalized query string"""
+    params = sorted((name, sorted(query_params.getlist(name))) for name in query_params)
+    raw = f"{generation}|{scope}|{base_url}|{params}"
+    return 'files:response:' + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def file_saved_or_deleted(sender, instance, using, **kwargs):
+    invalidate_files(using)
@@ -0,0 +1,290 @@
+"""Sub-file deduplication with content-defined chunking.
+
+When ``settings.FILES_CHUNKING['ENABLED']`` is set, uploads of at least
+``MIN_FILE_SIZE`` bytes that are not whole-file duplicates are split with
+FastCDC (the ``fastcdc`` package) into chunks of about ``AVG_SIZE`` bytes.
+Each distinct chunk is stored once under ``chunks/ab/cd/<sha256>`` with a
+reference count, and the File row becomes a manifest of FileChunk rows, so
+two large files that differ by a few bytes share all but a few chunks.
+Boundaries depend only on the content, which is why an insertion early in a
+file does not shift every later chunk.
+"""
+import bisect
+import hashlib
+import io
+import logging
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+
+from .models import Chunk, FileChunk
+from .storage import blob_locks, chunk_name, get_blob_storage, lock_stripe
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MIN_FILE_SIZE': 1024 * 1024,
+    'AVG_SIZE': 64 * 1024,
+    # FastCDC's usual bounds: a quarter and four times the average
+    'MIN_SIZE': None,
+    'MAX_SIZE': None,
+}
+# Rows per IN list or INSERT, well under SQLite's bound-parameter limit
+BATCH_SIZE = 400
+
+
+def get_setting(name):
+    value = getattr(settings, 'FILES_CHUNKING', {}).get(name, DEFAULTS[name])
+    if value is None and name in ('MIN_SIZE', 'MAX_SIZE'):
+        average = get_setting('AVG_SIZE')
+        return average // 4 if name == 'MIN_SIZE' else average * 4
+    return value
+
+
+def should_chunk(size):
+    return bool(get_setting('ENABLED')) and size >= get_setting('MIN_FILE_SIZE')
+
+
+def _fastcdc():
+    try:
+        from fastcdc import fastcdc
+    except ImportError:
+        raise ImproperlyConfigured("Chunked storage (FILES_CHUNKING) requires the fastcdc package")
+    return fastcdc
+
+
+def _source(file_obj):
+    """A path or buffer FastCDC can map without copying the upload"""
+    if hasattr(file_obj, 'temporary_file_path'):
+        return file_obj.temporary_file_path()
+    inner = getattr(file_obj, 'file', file_obj)
+    if isinstance(inner, io.BytesIO):
+        return inner.getbuffer()
+    path = getattr(inner, 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        # Stored blobs opened from the filesystem
+        return path
+    file_obj.seek(0)
+    return file_obj.read()
+
+
+def iter_chunks(file_obj, avg_size=None):
+    """Yield ``(offset, data)`` for each content-defined chunk of ``file_obj``"""
+    fastcdc = _fastcdc()
+    if avg_size is None:
+        avg_size, min_size, max_size = get_setting('AVG_SIZE'), get_setting('MIN_SIZE'), get_setting('MAX_SIZE')
+    else:
+        min_size, max_size = avg_size // 4, avg_size * 4
+    source = _source(file_obj)
+    boundaries = fastcdc(source, min_size, avg_size, max_size, fat=False)
+    if isinstance(source, str):
+        with open(source, 'rb') as stream:
+            for boundary in boundaries:
+                yield boundary.offset, stream.read(boundary.length)
+    else:
+        view = memoryview(source)
+        for boundary in boundaries:
+            yield boundary.offset, view[boundary.offset:boundary.offset + boundary.length]
+
+
+def store_chunks(file_obj):
+    """Write the chunks of ``file_obj`` that are not stored yet and return its manifest.
+
+    The manifest is a list of ``(offset, sha256, size)``. Blobs are written
+    before any transaction, like whole-file blobs in batch uploads; ones
+    whose rows never commit are left for ``gc_blobs``.
+    """
+    storage = get_blob_storage()
+    manifest = []
+    for offset, data in iter_chunks(file_obj):
+        digest = hashlib.sha256(data).hexdigest()
+        storage.save_chunk(digest, data)
+        manifest.append((offset, digest, len(data)))
+    logger.info(f"Split {file_obj.name} into {len(manifest)} chunks ({len(set(d for _, d, _ in manifest))} distinct)")
+    return manifest
+
+
+def restore_missing_chunks(file_obj, manifest):
+    """Write again any chunk blob deleted since store_chunks; call while holding the chunks' blob_locks"""
+    storage = get_blob_storage()
+    restored = set()
+    for offset, digest, size in manifest:
+        if digest in restored or storage.exists(chunk_name(digest)):
+            continue
+        file_obj.seek(offset)
+        storage.save_chunk(digest, file_obj.read(size))
+        restored.add(digest)
+    if restored:
+        logger.info(f"Restored {len(restored)} chunks deleted while {file_obj.name} was being stored")
+
+
+def add_manifest(instance, manifest):
+    """Reference the manifest's chunks from ``instance``; call inside the transaction creating it"""
+    counts = Counter(digest for _, digest, _ in manifest)
+    sizes = {digest: size for _, digest, size in manifest}
+    digests = list(counts)
+    chunk_ids = {}
+    for start in range(0, len(digests), BATCH_SIZE):
+        batch = digests[start:start + BATCH_SIZE]
+        Chunk.objects.bulk_create(
+            [Chunk(hash=digest, size=sizes[digest]) for digest in batch], ignore_conflicts=True
+        )
+        by_increment = defaultdict(list)
+        for digest in batch:
+            by_increment[counts[digest]].append(digest)
+        for increment, group in by_increment.items():
+            Chunk.objects.filter(hash__in=group).update(reference_count=F('reference_count') + increment)
+        chunk_ids.update(Chunk.objects.filter(hash__in=batch).values_list('hash', 'id'))
+        missing = [digest for digest in batch if digest not in chunk_ids]
+        if missing:
+            # Released and deleted by a concurrent delete between the insert and the update
+            created = Chunk.objects.bulk_create(
+                [Chunk(hash=digest, size=sizes[digest], reference_count=counts[digest]) for digest in missing]
+            )
+            chunk_ids.update(Chunk.objects.filter(hash__in=missing).values_list('hash', 'id'))
+            logger.info(f"Recreated {len(created)} chunks released while {instance.pk} was stored")
+    FileChunk.objects.bulk_create(
+        [FileChunk(file=instance, chunk_id=chunk_ids[digest], offset=offset) for offset, digest, _ in manifest],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def release_chunks(file_ids):
+    """Drop the chunk references of these files, deleting chunks that reach zero.
+
+    Runs inside the caller's transaction; the blobs of deleted chunks are
+    removed once it commits.
+    """
+    entries = FileChunk.objects.filter(file_id__in=file_ids)
+    used = (
+        entries.filter(chunk=OuterRef('pk'))
+        .order_by()
+        .values('chunk')
+        .annotate(uses=Count('id'))
+        .values('uses')
+    )
+    chunk_ids = list(entries.values_list('chunk_id', flat=True).distinct())
+    for start in range(0, len(chunk_ids), BATCH_SIZE):
+        Chunk.objects.filter(pk__in=chunk_ids[start:start + BATCH_SIZE]).update(
+            reference_count=F('reference_count') - Subquery(used)
+        )
+    entries.delete()
+    names = []
+    for start in range(0, len(chunk_ids), BATCH_SIZE):
+        unused = Chunk.objects.filter(pk__in=chunk_ids[start:start + BATCH_SIZE], reference_count=0)
+        names.extend(chunk_name(digest) for digest in unused.values_list('hash', flat=True))
+        unused.delete()
+    if names:
+        transaction.on_commit(lambda: remove_chunk_blobs(names))
+    logger.info(f"Released {len(chunk_ids)} chunks of {len(file_ids)} files, {len(names)} no longer used")
+
+
+def remove_chunk_blobs(names):
+    """Delete chunk blobs that no Chunk row refers to any more; returns how many were removed.
+
+    Each lock stripe is re-checked and deleted under its exclusive blob lock,
+    so a chunk an upload is about to reference again is kept.
+    """
+    by_stripe = defaultdict(dict)
+    for name in names:
+        if name:
+            by_stripe[lock_stripe(name)][os.path.basename(name)] = name
+    storage = get_blob_storage()
+    removed = 0
+    for stripe, by_digest in sorted(by_stripe.items()):
+        with blob_locks([stripe], exclusive=True):
+            digests = list(by_digest)
+            in_use = set()
+            for start in range(0, len(digests), BATCH_SIZE):
+                in_use.update(
+                    Chunk.objects.filter(hash__in=digests[start:start + BATCH_SIZE]).values_list('hash', flat=True)
+                )
+            for digest, name in by_digest.items():
+                if digest in in_use:
+                    continue
+                try:
+                    storage.delete(name)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not remove chunk {name}: {e}")
+    return removed
+
+
+def file_will_delete(sender, instance, **kwargs):
+    """pre_delete receiver: release a chunked file's chunks before its manifest is cascaded away"""
+    if instance.is_chunked:
+        release_chunks([instance.pk])
+
+
+class ChunkedFile(io.RawIOBase):
+    """Read-only, seekable file object over a chunked file, opening one chunk blob at a time.
+
+    The manifest is loaded up front, so reads only touch storage and can run
+    on any thread.
+    """
+
+    def __init__(self, instance, storage=None):
+        super().__init__()
+        self.storage = storage or get_blob_storage()
+        rows = FileChunk.objects.filter(file=instance).order_by('offset').values_list(
+            'offset', 'chunk__hash', 'chunk__size'
+        )
+        self.offsets, self.digests, self.sizes = [], [], []
+        for offset, digest, size in rows:
+            self.offsets.append(offset)
+            self.digests.append(digest)
+            self.sizes.append(size)
+        self.size = self.offsets[-1] + self.sizes[-1] if self.offsets else 0
+        self.position = 0
+        self._index = None
+        self._blob = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        index = bisect.bisect_right(self.offsets, self.position) - 1
+        if index != self._index:
+            self._close_blob()
+            self._blob = self.storage.open(chunk_name(self.digests[index]), 'rb')
+            self._index = index
+        self._blob.seek(self.position - self.offsets[index])
+        view = memoryview(buffer)[:self.offsets[index] + self.sizes[index] - self.position]
+        read = self._blob.readinto(view)
+        if not read:
+            raise IOError(f"Chunk {self.digests[index]} is shorter than its manifest entry")
+        self.position += read
+        return read
+
+    def _close_blob(self):
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+            self._index = None
+
+    def close(self):
+        self._close_blob()
+        super().close()
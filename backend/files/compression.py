@@ -0,0 +1,173 @@
+"""Compression at rest for stored blobs.
+
+``settings.FILES_COMPRESSION`` picks the codec (``gzip``, or ``zstd`` with the
+``zstandard`` package) and level. ``TYPES`` maps ``fnmatch`` patterns of
+file types to overrides: a dict with ``codec``/``level``, or None to store
+that type raw. Types in ALREADY_COMPRESSED are stored raw unless ``TYPES``
+says otherwise, and so is anything that does not shrink by ``MIN_SAVINGS``.
+
+Compressed blobs keep the content address of the original bytes plus a codec
+suffix (``cas/ab/cd/<sha256>.gz``); the codec and the size on disk are
+recorded on the File row.
+"""
+import fnmatch
+import gzip
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .hashing import get_setting as get_hashing_setting
+from .metrics import COMPRESS_SECONDS, phase
+from .storage import get_blob_storage
+from .upload_sessions import StagedFile
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Off unless configured: Range requests into compressed blobs cost a decode from the start
+    'CODEC': '',
+    'LEVEL': 6,
+    # Smaller files are not worth a codec round trip
+    'MIN_SIZE': 1024,
+    # Store raw unless compression saves at least this share of the bytes
+    'MIN_SAVINGS': 0.1,
+    'TYPES': {},
+}
+
+# Formats that carry their own compression; checked after settings' TYPES
+ALREADY_COMPRESSED = {
+    'image/svg+xml': {},
+    'image/*': None,
+    'video/*': None,
+    'audio/*': None,
+    'font/woff*': None,
+    'application/pdf': None,
+    'application/zip': None,
+    'application/x-zip-compressed': None,
+    'application/java-archive': None,
+    'application/gzip': None,
+    'application/x-gzip': None,
+    'application/zstd': None,
+    'application/x-bzip2': None,
+    'application/x-xz': None,
+    'application/x-7z-compressed': None,
+    'application/x-rar-compressed': None,
+    'application/vnd.rar': None,
+    'application/vnd.openxmlformats-officedocument.*': None,
+    'application/vnd.oasis.opendocument.*': None,
+}
+
+# Content-Encoding tokens for each codec
+CONTENT_ENCODINGS = {
+    'gzip': 'gzip',
+    'zstd': 'zstd',
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'FILES_COMPRESSION', {}).get(name, DEFAULTS[name])
+
+
+def policy_for(file_type):
+    """``(codec, level)`` to store this type with; an empty codec means raw"""
+    file_type = (file_type or '').lower()
+    for types in (get_setting('TYPES'), ALREADY_COMPRESSED):
+        for pattern, override in types.items():
+            if fnmatch.fnmatchcase(file_type, pattern):
+                if override is None:
+                    return '', None
+                return override.get('codec', get_setting('CODEC')) or '', override.get('level', get_setting('LEVEL'))
+    return get_setting('CODEC') or '', get_setting('LEVEL')
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("The zstd codec requires the zstandard package")
+    return zstandard
+
+
+def _compressor(codec, level, output):
+    if codec == 'gzip':
+        # mtime=0 keeps the output identical for identical input
+        return gzip.GzipFile(fileobj=output, mode='wb', compresslevel=level, mtime=0)
+    if codec == 'zstd':
+        return _zstandard().ZstdCompressor(level=level).stream_writer(output, closefd=False)
+    raise ImproperlyConfigured(f"Unknown compression codec {codec!r}")
+
+
+class CompressedFile(StagedFile):
+    """A compressed copy of an upload on the staging volume, addressed by the upload's SHA-256"""
+
+    def __init__(self, path, name, content_type, sha256, codec):
+        super().__init__(path, name, content_type, sha256)
+        self.codec = codec
+
+
+def compress_for_storage(file_obj, file_hash, file_type):
+    """Return ``(content, codec)`` to hand to blob storage for this upload.
+
+    ``content`` is a CompressedFile when the policy picks a codec and the
+    bytes shrink enough, otherwise ``file_obj`` itself with an empty codec.
+    ``content.size`` is what ends up on disk.
+    """
+    codec, level = policy_for(file_type)
+    if not codec or file_obj.size < get_setting('MIN_SIZE'):
+        return file_obj, ''
+
+    storage = get_blob_storage()
+    staging_dir = storage.path(storage.staging_dirname)
+    os.makedirs(staging_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=staging_dir, suffix='.compress')
+    try:
+        with phase('compress', COMPRESS_SECONDS.labels(codec)), os.fdopen(fd, 'wb') as output:
+            with _compressor(codec, level, output) as writer:
+                for chunk in file_obj.chunks(get_hashing_setting('CHUNK_SIZE')):
+                    writer.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+
+    stored_size = os.path.getsize(path)
+    if stored_size > file_obj.size * (1 - get_setting('MIN_SAVINGS')):
+        logger.info(f"{codec} saves too little on {file_obj.name} ({file_obj.size} -> {stored_size} bytes), storing raw")
+        os.remove(path)
+        return file_obj, ''
+    logger.info(f"Compressed {file_obj.name} with {codec} level {level}: {file_obj.size} -> {stored_size} bytes")
+    return CompressedFile(path, file_obj.name, file_obj.content_type, file_hash, codec), codec
+
+
+class DecodedFile:
+    """Decompressing reader over a stored blob; closing it closes the blob too.
+
+    Seeking forward decompresses and discards the bytes in between, so Range
+    requests on compressed blobs cost time proportional to their offset.
+    """
+
+    def __init__(self, raw, codec):
+        self.raw = raw
+        if codec == 'gzip':
+            self.reader = gzip.GzipFile(fileobj=raw, mode='rb')
+        elif codec == 'zstd':
+            self.reader = _zstandard().ZstdDecompressor().stream_reader(raw, closefd=False)
+        else:
+            raise ImproperlyConfigured(f"Unknown compression codec {codec!r}")
+
+    def read(self, size=-1):
+        return self.reader.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.reader.seek(offset, whence)
+
+    def tell(self):
+        return self.reader.tell()
+
+    def close(self):
+        try:
+            self.reader.close()
+        finally:
+            self.raw.close()
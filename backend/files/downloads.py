@@ -0,0 +1,245 @@
+import re
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import content_disposition_header, parse_etags
+
+from .chunking import ChunkedFile
+from .compression import CONTENT_ENCODINGS, DecodedFile
+
+logger = logging.getLogger(__name__)
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+QUALITY_RE = re.compile(r'(?:^|;)\s*q=([0-9.]+)')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Parse a single-range ``Range`` header into inclusive ``(start, end)`` offsets.
+
+    Returns None when the header is absent or not a single byte range (the
+    whole file is then served), and raises RangeNotSatisfiable when it
+    cannot be met.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_file_range(file_obj, start, length, block_size=STREAM_BLOCK_SIZE):
+    """Yield ``length`` bytes of ``file_obj`` starting at ``start``, closing it when done"""
+    try:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = file_obj.read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file_obj.close()
+
+
+async def aiter_file_range(file_obj, start, length, block_size=STREAM_BLOCK_SIZE):
+    """Async iter_file_range: blocking reads run on a thread so the event loop keeps serving others"""
+    read = sync_to_async(file_obj.read, thread_sensitive=False)
+    try:
+        await sync_to_async(file_obj.seek, thread_sensitive=False)(start)
+        remaining = length
+        while remaining > 0:
+            data = await read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file_obj.close()
+
+
+def blob_for(instance):
+    """Return the File row that owns the stored bytes; references point at their original"""
+    if instance.is_reference and instance.original_file_id:
+        return instance.original_file
+    return instance
+
+
+def open_blob(blob, decode=True):
+    """Open the stored bytes for reading; chunked files are reassembled and compressed ones decoded as they are read"""
+    if blob.is_chunked:
+        return ChunkedFile(blob)
+    raw = blob.file.storage.open(blob.file.name, 'rb')
+    if blob.codec and decode:
+        return DecodedFile(raw, blob.codec)
+    return raw
+
+
+def blob_size(blob):
+    return blob.size if blob.is_chunked or blob.codec else blob.file.size
+
+
+def accepts_encoding(request, codec):
+    """Whether Accept-Encoding allows the codec's Content-Encoding (a q of 0 refuses it)"""
+    token = CONTENT_ENCODINGS.get(codec)
+    header = request.headers.get('Accept-Encoding')
+    if not token or not header:
+        return False
+    qualities = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        match = QUALITY_RE.search(params)
+        try:
+            qualities[name.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    aliases = [token, 'x-gzip'] if token == 'gzip' else [token]
+    for name in aliases + ['*']:
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def content_encoding(request, blob):
+    """The Content-Encoding to send the stored bytes with as they are, or '' to decode them first.
+
+    Range requests are always answered from the decoded bytes, whose offsets
+    the client knows.
+    """
+    if blob.codec and not request.headers.get('Range') and accepts_encoding(request, blob.codec):
+        return CONTENT_ENCODINGS[blob.codec]
+    return ''
+
+
+def file_etag(blob, encoding=''):
+    # The content hash identifies the bytes exactly, so it makes a strong validator;
+    # the encoded representation is different bytes and needs its own
+    return f'"{blob.hash}-{encoding}"' if encoding else f'"{blob.hash}"'
+
+
+def _sendfile_response(blob, backend):
+    """Hand the transfer to the fronting proxy, which also takes care of Range requests"""
+    response = HttpResponse()
+    if backend == 'nginx':
+        prefix = settings.FILES_SENDFILE_URL_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f"{prefix}/{blob.file.name}"
+    elif backend == 'apache':
+        response['X-Sendfile'] = blob.file.path
+    else:
+        raise ValueError(f"Unknown FILES_SENDFILE_BACKEND: {backend}")
+    # Let the proxy fill in the body headers from the file it serves
+    del response['Content-Type']
+    return response
+
+
+def build_download_response(request, instance, asynchronous=False):
+    """Serve the bytes of a File with ETag, conditional GET and single-range support.
+
+    With ``asynchronous`` the body is an async iterator, as async views need
+    under ASGI (Django would otherwise read a sync body into memory first).
+    References must come with ``original_file`` already loaded. Chunked files
+    load their manifest here, so async views call this in a thread for them.
+    """
+    blob = blob_for(instance)
+    encoding = content_encoding(request, blob)
+    etag = file_etag(blob, encoding)
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        if blob.codec:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    if not blob.file and not blob.is_chunked:
+        return HttpResponse(status=404)
+
+    # A proxy can only send whole blobs from disk as they are, so chunked files
+    # and compressed ones the client cannot take encoded are streamed here
+    direct = blob.is_chunked or (blob.codec and not encoding)
+    backend = None if direct else settings.FILES_SENDFILE_BACKEND
+    if backend:
+        response = _sendfile_response(blob, backend)
+    else:
+        response = _direct_response(request, blob, etag, encoding, asynchronous)
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if blob.codec:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(True, instance.original_filename)
+    if response.status_code != 416 and not backend:
+        response['Content-Type'] = blob.file_type or 'application/octet-stream'
+    return response
+
+
+def _direct_response(request, blob, etag, encoding='', asynchronous=False):
+    """Stream the blob from Django, honouring Range unless If-Range no longer matches.
+
+    With an ``encoding`` the stored compressed bytes are sent as they are.
+    """
+    if encoding:
+        file_obj = open_blob(blob, decode=False)
+        if asynchronous:
+            size = blob.stored_size if blob.stored_size is not None else blob.file.size
+            response = StreamingHttpResponse(aiter_file_range(file_obj, 0, size))
+            response['Content-Length'] = str(size)
+            return response
+        return FileResponse(file_obj)
+
+    size = blob_size(blob)
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and if_range and if_range.strip() != etag:
+        # The client's partial copy is stale, so it gets the whole file
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    file_obj = open_blob(blob)
+    if byte_range is None:
+        if asynchronous or blob.codec:
+            stream = aiter_file_range if asynchronous else iter_file_range
+            response = StreamingHttpResponse(stream(file_obj, 0, size))
+            response['Content-Length'] = str(size)
+            return response
+        # FileResponse uses wsgi.file_wrapper (sendfile) when the server provides it
+        return FileResponse(file_obj)
+
+    start, end = byte_range
+    length = end - start + 1
+    logger.info(f"Serving bytes {start}-{end}/{size} of {blob.file.name or blob.hash}")
+    stream = aiter_file_range if asynchronous else iter_file_range
+    response = StreamingHttpResponse(stream(file_obj, start, length), status=206)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    return response
@@ -1,5 +1,7 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
 from .models import File
+from .search import contains_condition, with_search_rowid
 import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
@@ -7,6 +9,20 @@ from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
 
+class FileSearchFilter(SearchFilter):
+    """The ``search`` parameter, answered from the search index instead of LIKE scans"""
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        columns = tuple(getattr(view, 'search_fields', None) or ())
+        queryset = with_search_rowid(queryset)
+        for term in search_terms:
+            queryset = queryset.filter(contains_condition(term, columns, using=queryset.db))
+        return queryset
+
+
 class FileFilter(filters.FilterSet):
     min_size = filters.NumberFilter(field_name='size', lookup_expr='gte')
     max_size = filters.NumberFilter(field_name='size', lookup_expr='lte')
@@ -16,6 +32,7 @@ class FileFilter(filters.FilterSet):
     is_reference = filters.BooleanFilter(field_name='is_reference')
     min_reference_count = filters.NumberFilter(field_name='reference_count', lookup_expr='gte')
     max_reference_count = filters.NumberFilter(field_name='reference_count', lookup_expr='lte')
+    original_filename__icontains = filters.CharFilter(field_name='original_filename', method='filter_filename_contains')
     
     class Meta:
         model = File
@@ -34,6 +51,12 @@ class FileFilter(filters.FilterSet):
             value = value[1:]
         return queryset.filter(file_type__iexact=value)
 
+    def filter_filename_contains(self, queryset, name, value):
+        if not value:
+            return queryset
+        queryset = with_search_rowid(queryset)
+        return queryset.filter(contains_condition(value, ('original_filename',), using=queryset.db))
+
     def filter_start_date(self, queryset, name, value):
         logger.info(f"Filtering start date (raw value): {value}")
         
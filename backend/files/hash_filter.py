@@ -0,0 +1,247 @@
+"""Per-process Bloom filter of stored file hashes, to skip dedup lookups for new content.
+
+Most uploads in a burst carry content that is not stored yet, so the
+``hash=... AND NOT is_reference`` lookup usually finds nothing. When the
+filter says a hash was never stored, ingest skips that query; a positive
+answer (possibly false) still goes to the database.
+
+Each worker process keeps its own filter. It is warmed by streaming the
+``hash`` column, gets the hashes this process stores as it stores them, and
+every ``REFRESH_INTERVAL`` seconds picks up what other workers stored
+recently. A hash another worker stored since the last refresh can still be
+missed: that upload then hits ``unique_hash_for_non_reference`` and
+ingest_upload adds the hash and retries, as for any lost race, so results
+never change. Deleted hashes cannot be taken out of a Bloom filter; they
+only count towards a rebuild.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Hashes the filter is sized for before it grows
+    'CAPACITY': 1_000_000,
+    'ERROR_RATE': 0.01,
+    # Upper bound on the bit array, whatever the number of stored files
+    'MAX_BYTES': 16 * 1024 * 1024,
+    'REFRESH_INTERVAL': 5,
+    # Rebuild once this share of the hashes added has been deleted again
+    'REBUILD_STALE_RATIO': 0.5,
+}
+# Rows committed this long after their uploaded_at are still picked up by a refresh
+REFRESH_SLACK = timedelta(seconds=60)
+WARM_CHUNK_SIZE = 10000
+
+
+def get_setting(name):
+    return getattr(settings, 'FILES_HASH_FILTER', {}).get(name, DEFAULTS[name])
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, with k positions by double hashing one BLAKE2b digest"""
+
+    def __init__(self, capacity, error_rate, max_bytes):
+        capacity = max(capacity, 1)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(min(bits, max_bytes * 8), 8)
+        self.hashes = max(1, min(round(self.size / capacity * math.log(2)), 16))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        """Set the value's bits; only values that set a new bit are counted"""
+        bits = self.bits
+        added = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        self.count += added
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def error_rate(self):
+        """Expected false positive rate at the current number of items"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class HashFilter:
+    """The process-wide filter with its counters; use the module's ``hash_filter`` instance"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # One thread syncs at a time; the others keep answering from the current filter
+        self.sync_lock = threading.Lock()
+        self.bloom = None
+        self.capacity = 0
+        self.database = None
+        self.synced_at = None
+        self.next_sync = 0.0
+        self.stale = 0
+        self.pending = None
+        self.counters = dict.fromkeys(
+            ('lookups', 'negatives', 'positives', 'false_positives', 'refreshes', 'rebuilds'), 0
+        )
+
+    def enabled(self):
+        return bool(get_setting('ENABLED'))
+
+    def _needs_sync(self):
+        if not self.enabled():
+            return False
+        return (
+            self.bloom is None or time.monotonic() >= self.next_sync
+            or self.database != connection.settings_dict['NAME']
+        )
+
+    def sync(self):
+        """Warm the filter, rebuild it when it has gone stale or full, or pick up recent hashes"""
+        bloom = self.bloom
+        if (bloom is None or self.database != connection.settings_dict['NAME']
+                or self.stale > bloom.count * get_setting('REBUILD_STALE_RATIO')
+                or bloom.count > self.capacity):
+            self.warm()
+        else:
+            self.refresh()
+
+    def warm(self):
+        """Build a new filter from every stored hash and swap it in"""
+        started = time.monotonic()
+        self.next_sync = started + get_setting('REFRESH_INTERVAL')
+        since = timezone.now() - REFRESH_SLACK
+        with self.lock:
+            self.pending = []
+        try:
+            stored = File.objects.filter(is_reference=False).exclude(hash='')
+            self.capacity = max(get_setting('CAPACITY'), stored.count() * 2)
+            bloom = BloomFilter(self.capacity, get_setting('ERROR_RATE'), get_setting('MAX_BYTES'))
+            for file_hash in stored.values_list('hash', flat=True).iterator(chunk_size=WARM_CHUNK_SIZE):
+                bloom.add(file_hash)
+        except DatabaseError as e:
+            # Unmigrated or unreachable database; every lookup goes to the database until a later sync
+            logger.warning(f"Could not warm the hash filter: {e}")
+            with self.lock:
+                self.pending = None
+            return
+        with self.lock:
+            # Hashes this process stored while the column was being read
+            for file_hash in self.pending:
+                bloom.add(file_hash)
+            self.pending = None
+            self.bloom, self.stale = bloom, 0
+            self.database = connection.settings_dict['NAME']
+            self.synced_at = since
+            self.counters['rebuilds'] += 1
+        logger.info(
+            f"Warmed hash filter with {bloom.count} hashes in {time.monotonic() - started:.2f}s "
+            f"({len(bloom.bits)} bytes, {bloom.hashes} hashes, ~{bloom.error_rate():.2%} false positives)"
+        )
+
+    def refresh(self):
+        """Add hashes stored by any worker since the last sync"""
+        self.next_sync = time.monotonic() + get_setting('REFRESH_INTERVAL')
+        since = timezone.now() - REFRESH_SLACK
+        try:
+            recent = list(
+                File.objects.filter(is_reference=False, uploaded_at__gte=self.synced_at)
+                .exclude(hash='').values_list('hash', flat=True)
+            )
+        except DatabaseError as e:
+            logger.warning(f"Could not refresh the hash filter: {e}")
+            return
+        self.add_many(recent)
+        self.synced_at = since
+        self.counters['refreshes'] += 1
+
+    def add(self, file_hash):
+        self.add_many([file_hash])
+
+    def add_many(self, file_hashes):
+        """Record stored hashes; the bit updates are not atomic, so writers take the lock"""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.extend(file_hashes)
+            if self.bloom is not None:
+                for file_hash in file_hashes:
+                    self.bloom.add(file_hash)
+
+    def forget(self, count=1):
+        """Note deleted hashes; they stay in the filter as false positives until the next rebuild"""
+        self.stale += count
+
+    def _check(self, file_hash):
+        self.counters['lookups'] += 1
+        if self.bloom is None or file_hash in self.bloom:
+            self.counters['positives'] += 1
+            return True
+        self.counters['negatives'] += 1
+        return False
+
+    def might_exist(self, file_hash):
+        """False only when no stored file has this hash, so the database lookup can be skipped"""
+        if not self.enabled():
+            return True
+        if self._needs_sync() and self.sync_lock.acquire(blocking=False):
+            try:
+                self.sync()
+            finally:
+                self.sync_lock.release()
+        return self._check(file_hash)
+
+    def confirm(self, found, checked=1):
+        """Record how many of ``checked`` positive answers the database lookup actually found"""
+        self.counters['false_positives'] += checked - found
+
+    def stats(self):
+        bloom = self.bloom
+        return {
+            'enabled': self.enabled(),
+            'hashes': bloom.count if bloom else 0,
+            'stale': self.stale,
+            'bytes': len(bloom.bits) if bloom else 0,
+            'hash_functions': bloom.hashes if bloom else 0,
+            'expected_error_rate': round(bloom.error_rate(), 6) if bloom else None,
+            **self.counters,
+        }
+
+
+hash_filter = HashFilter()
+
+
+def warm_hash_filter():
+    """Load the filter as a worker starts (core/wsgi.py, core/asgi.py) instead of on its first upload"""
+    if hash_filter.enabled():
+        with hash_filter.sync_lock:
+            hash_filter.warm()
+
+
+def file_saved(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver: stored files are added as soon as they are saved, before commit"""
+    if created and not raw and not instance.is_reference and instance.hash:
+        hash_filter.add(instance.hash)
+
+
+def file_deleted(sender, instance, **kwargs):
+    if not instance.is_reference and instance.hash:
+        hash_filter.forget()
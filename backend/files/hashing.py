@@ -0,0 +1,82 @@
+"""Content hashing for uploads and stored blobs.
+
+Every content address is a SHA-256. ``settings.FILES_HASHING`` tunes how the
+bytes are fed to it: ``CHUNK_SIZE`` is the read size for files already on
+disk or in memory, ``UPLOAD_CHUNK_SIZE`` the size of the chunks the upload
+handlers receive and hash while a request streams in.
+"""
+import hashlib
+import io
+import time
+
+from django.conf import settings
+
+from .metrics import record_hashing
+
+DEFAULTS = {
+    'CHUNK_SIZE': 1024 * 1024,
+    'UPLOAD_CHUNK_SIZE': 256 * 1024,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'FILES_HASHING', {}).get(name, DEFAULTS[name])
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def hash_stream(stream, hasher=None, chunk_size=None, limit=None):
+    """Feed a binary stream (up to ``limit`` bytes) into ``hasher`` and return it.
+
+    Reads go through ``readinto`` on one reused buffer, so no bytes object is
+    allocated per chunk; hashlib releases the GIL while it digests each one.
+    """
+    hasher = hasher or new_hasher()
+    chunk_size = chunk_size or get_setting('CHUNK_SIZE')
+    remaining = limit
+    total = 0
+    start = time.perf_counter()
+    if not hasattr(stream, 'readinto'):
+        while remaining is None or remaining > 0:
+            data = stream.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            total += len(data)
+            if remaining is not None:
+                remaining -= len(data)
+        record_hashing('file', total, time.perf_counter() - start)
+        return hasher
+
+    view = memoryview(bytearray(chunk_size))
+    while remaining is None or remaining > 0:
+        read = stream.readinto(view if remaining is None or remaining >= chunk_size else view[:remaining])
+        if not read:
+            break
+        hasher.update(view[:read])
+        total += read
+        if remaining is not None:
+            remaining -= read
+    record_hashing('file', total, time.perf_counter() - start)
+    return hasher
+
+
+def hash_file(file_obj, chunk_size=None):
+    """SHA-256 hex digest of a Django File from its first byte"""
+    if hasattr(file_obj, 'temporary_file_path'):
+        # Unbuffered, so readinto goes straight from the kernel into our buffer
+        with open(file_obj.temporary_file_path(), 'rb', buffering=0) as stream:
+            return hash_stream(stream, chunk_size=chunk_size).hexdigest()
+    raw = getattr(file_obj, 'file', file_obj)
+    if isinstance(raw, io.BytesIO):
+        # In-memory uploads are hashed in place without copying
+        hasher = new_hasher()
+        start = time.perf_counter()
+        with raw.getbuffer() as view:
+            hasher.update(view)
+            record_hashing('file', len(view), time.perf_counter() - start)
+        return hasher.hexdigest()
+    file_obj.seek(0)
+    return hash_stream(raw, chunk_size=chunk_size).hexdigest()
@@ -0,0 +1,211 @@
+import os
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.files.move import file_move_safe
+from django.db import DatabaseError, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .hashing import get_setting, hash_stream, new_hasher
+from .models import IngestJob
+from .services import ingest_upload, upload_error
+from .upload_sessions import StagedFile
+
+logger = logging.getLogger(__name__)
+
+# How often a worker hashing a large upload reports progress
+PROGRESS_INTERVAL = 8 * 1024 * 1024
+# Seconds between heartbeats of a running job; keep well below --stale-after
+HEARTBEAT_INTERVAL = 30
+# A job is given up after this many workers died while running it
+MAX_ATTEMPTS = 3
+# Queued jobs a worker picks from at random, so idle workers do not all race for the oldest
+CLAIM_CANDIDATES = 16
+
+
+def enqueue(file_obj):
+    """Move an upload to the job staging area and queue it; returns the job.
+
+    Only the bytes are handled in the request: uploads that were streamed to a
+    temporary file are renamed, small in-memory ones written out once.
+    """
+    error = upload_error(file_obj)
+    if error:
+        raise ValueError(error)
+
+    job = IngestJob(
+        original_filename=file_obj.name,
+        file_type=file_obj.content_type,
+        size=file_obj.size,
+        hash=getattr(file_obj, 'sha256', None) or '',
+    )
+    os.makedirs(os.path.dirname(job.staging_path), exist_ok=True)
+    if hasattr(file_obj, 'temporary_file_path'):
+        file_move_safe(file_obj.temporary_file_path(), job.staging_path)
+    else:
+        with open(job.staging_path, 'wb') as staged:
+            for chunk in file_obj.chunks(get_setting('CHUNK_SIZE')):
+                staged.write(chunk)
+    try:
+        job.save()
+    except Exception:
+        os.remove(job.staging_path)
+        raise
+    return job
+
+
+class JobLost(Exception):
+    """The job was requeued or finished elsewhere while this worker was running it"""
+
+
+def claim_job(worker):
+    """Atomically take a queued job for ``worker``, or return None when there is none.
+
+    The conditional UPDATE only succeeds for one worker per job, across
+    threads and processes alike, so no external broker or row locks are needed.
+    """
+    while True:
+        candidates = list(
+            IngestJob.objects.filter(status=IngestJob.QUEUED)
+            .order_by('created_at')
+            .values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+        )
+        if not candidates:
+            return None
+        random.shuffle(candidates)
+        for job_id in candidates:
+            claimed = IngestJob.objects.filter(pk=job_id, status=IngestJob.QUEUED).update(
+                status=IngestJob.RUNNING,
+                worker=worker,
+                started_at=timezone.now(),
+                heartbeat_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return IngestJob.objects.get(pk=job_id)
+
+
+def requeue_stale(timeout):
+    """Give jobs whose worker stopped sending heartbeats back to the queue, failing those out of attempts"""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = IngestJob.objects.filter(status=IngestJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=IngestJob.FAILED, error="Worker stopped responding", finished_at=timezone.now()
+    )
+    requeued = stale.update(status=IngestJob.QUEUED, worker='')
+    if failed or requeued:
+        logger.warning(f"Requeued {requeued} stale ingest jobs, failed {failed}")
+    return requeued
+
+
+def owned(job):
+    """The job's row, as long as the worker that claimed it is still running it"""
+    return IngestJob.objects.filter(pk=job.pk, worker=job.worker, status=IngestJob.RUNNING)
+
+
+def heartbeat(job, **fields):
+    """Record that this worker is alive and still owns ``job``, along with ``fields``"""
+    if not owned(job).update(heartbeat_at=timezone.now(), **fields):
+        raise JobLost(f"Ingest job {job.id} is no longer running on {job.worker}")
+
+
+@contextmanager
+def keep_alive(job, interval=HEARTBEAT_INTERVAL):
+    """Send heartbeats from a background thread while a long step (hashing, storing) runs"""
+    stop_event = threading.Event()
+
+    def beat():
+        try:
+            while not stop_event.wait(interval):
+                try:
+                    heartbeat(job)
+                except JobLost as e:
+                    logger.warning(str(e))
+                    return
+                except DatabaseError as e:
+                    logger.warning(f"Heartbeat for ingest job {job.id} failed: {e}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"ingest-heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def _hash_with_progress(job):
+    hasher = new_hasher()
+    processed = 0
+    with open(job.staging_path, 'rb', buffering=0) as stream:
+        while True:
+            hash_stream(stream, hasher, limit=PROGRESS_INTERVAL)
+            if stream.tell() == processed:
+                break
+            processed = stream.tell()
+            heartbeat(job, bytes_processed=processed)
+    return hasher.hexdigest()
+
+
+def process_job(job):
+    """Hash (unless the upload handlers already did), deduplicate and store a claimed job.
+
+    Every status update is scoped to this worker's claim: if the job was
+    requeued meanwhile (its heartbeat went stale), the worker stops before
+    touching the staged upload, and never overwrites the new owner's result.
+    """
+    try:
+        with keep_alive(job):
+            file_hash = job.hash or _hash_with_progress(job)
+            # Last check before the staged upload is consumed
+            heartbeat(job)
+            staged = StagedFile(job.staging_path, job.original_filename, job.file_type, file_hash)
+            try:
+                instance, created = ingest_upload(staged, file_hash, job.original_filename, job.file_type, job.size)
+            finally:
+                staged.close()
+    except JobLost as e:
+        logger.warning(f"Abandoning ingest job: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Ingest job {job.id} failed: {str(e)}", exc_info=True)
+        if not owned(job).update(status=IngestJob.FAILED, error=str(e), finished_at=timezone.now()):
+            logger.warning(f"Ingest job {job.id} was taken over by another worker, not recording the failure")
+        return False
+
+    finished = owned(job).update(
+        status=IngestJob.DONE,
+        hash=file_hash,
+        file=instance,
+        created=created,
+        bytes_processed=job.size,
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        logger.warning(f"Ingest job {job.id} was taken over by another worker before it finished here")
+        return False
+    logger.info(f"Ingest job {job.id} stored as file {instance.id} (created: {created})")
+    return True
+
+
+def run_worker(worker, stop_event, poll_interval=1.0, drain=False):
+    """Process jobs until ``stop_event`` is set, or until the queue is empty when ``drain`` is set"""
+    try:
+        while not stop_event.is_set():
+            job = claim_job(worker)
+            if job is None:
+                if drain:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            process_job(job)
+    finally:
+        connection.close()
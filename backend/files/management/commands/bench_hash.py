@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.files import File as DjangoFile
+from django.core.management.base import BaseCommand
+
+from files.hashing import hash_stream
+
+
+def available_engines():
+    """Hash constructors to compare; BLAKE3 and xxHash only when their packages are installed"""
+    engines = {'sha256': hashlib.sha256, 'sha1': hashlib.sha1, 'blake2b': hashlib.blake2b}
+    try:
+        import blake3
+        engines['blake3'] = blake3.blake3
+    except ImportError:
+        pass
+    try:
+        import xxhash
+        engines['xxh3_128'] = xxhash.xxh3_128
+    except ImportError:
+        pass
+    return engines
+
+
+class Command(BaseCommand):
+    help = "Measure hashing throughput (MB/s) per engine and chunk size on this machine"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=256, help="Test file size in MB")
+        parser.add_argument('--chunk-sizes', default='65536,262144,1048576,4194304', help="Comma-separated chunk sizes in bytes")
+        parser.add_argument('--engines', default='', help="Comma-separated engines to run (default: all available)")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per combination; the best one is reported")
+
+    def handle(self, *args, **options):
+        engines = available_engines()
+        if options['engines']:
+            engines = {name: engines[name] for name in options['engines'].split(',') if name in engines}
+        chunk_sizes = [int(size) for size in options['chunk_sizes'].split(',')]
+        size = options['size'] * 1024 * 1024
+
+        with tempfile.NamedTemporaryFile(prefix='filehub-hash-') as sample:
+            block = os.urandom(1024 * 1024)
+            for _ in range(options['size']):
+                sample.write(block)
+            sample.flush()
+
+            def best_rate(run):
+                best = min(self.timed(run) for _ in range(options['repeat']))
+                return size / best / (1024 * 1024)
+
+            for name, engine in engines.items():
+                for chunk_size in chunk_sizes:
+                    def readinto_path():
+                        with open(sample.name, 'rb', buffering=0) as stream:
+                            hash_stream(stream, engine(), chunk_size=chunk_size).hexdigest()
+
+                    def chunks_path():
+                        # What compute_file_hash used to do: a new bytes object per chunk
+                        hasher = engine()
+                        with open(sample.name, 'rb') as stream:
+                            for chunk in DjangoFile(stream).chunks(chunk_size):
+                                hasher.update(chunk)
+                        hasher.hexdigest()
+
+                    self.stdout.write(
+                        f"{name:>9}  chunk {chunk_size // 1024:>5} KB  "
+                        f"readinto {best_rate(readinto_path):8.0f} MB/s  "
+                        f"chunks() {best_rate(chunks_path):8.0f} MB/s"
+                    )
+
+    def timed(self, run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from files.benchmarking import isolated_environment, seed_files, summarize, time_call
+from files.models import File
+from files.serializers import FileListSerializer, FileSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare FileSerializer with the FileListSerializer fast path on list pages, "
+        "checking that both render byte-identical JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', default='10,100,1000', help="Comma-separated page sizes to measure")
+        parser.add_argument('--reference-ratio', type=float, default=0.3, help="Share of rows that are references")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        renderer = JSONRenderer()
+        request = RequestFactory().get('/api/files/')
+        context = {'request': request}
+
+        with isolated_environment():
+            seed_files(max(page_sizes), reference_ratio=options['reference_ratio'])
+            queryset = File.objects.select_related('original_file').order_by('-uploaded_at', '-id')
+
+            for page_size in page_sizes:
+                def model_serializer():
+                    rows = list(queryset[:page_size])
+                    return renderer.render(FileSerializer(rows, many=True, context=context).data)
+
+                def fast_path():
+                    rows = list(queryset.values(*FileListSerializer.values)[:page_size])
+                    return renderer.render(FileListSerializer(rows, context=context).data)
+
+                if model_serializer() != fast_path():
+                    raise CommandError(f"Fast path output differs from FileSerializer at page size {page_size}")
+
+                baseline = summarize(time_call(model_serializer, options['repeat']))
+                fast = summarize(time_call(fast_path, options['repeat']))
+                self.stdout.write(
+                    f"page_size={page_size:>5}  FileSerializer p50 {baseline['p50_ms']:8.2f} ms  "
+                    f"FileListSerializer p50 {fast['p50_ms']:8.2f} ms  "
+                    f"speedup {baseline['p50_ms'] / fast['p50_ms']:.1f}x  (output identical)"
+                )
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from files.benchmarking import isolated_environment, read_write_workload, seed_files
+from files.sqlite import DEFAULTS
+
+# SQLite's own defaults, with the same busy timeout so only the tuning differs
+PROFILES = {
+    'rollback': {
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'busy_timeout': DEFAULTS['busy_timeout'],
+        'temp_store': 'default',
+    },
+    'tuned': DEFAULTS,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent file-list reads and uploads on SQLite with the default "
+        "rollback journal and with the tuned PRAGMAs (WAL, synchronous=NORMAL, mmap, cache)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help="Threads reading list pages")
+        parser.add_argument('--writers', type=int, default=2, help="Threads uploading small files")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds per profile")
+        parser.add_argument('--seed', type=int, default=10000, help="Rows in the table before the run")
+        parser.add_argument('--profiles', default=','.join(PROFILES), help="Comma-separated profiles to run")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_sqlite measures SQLite; the default database is " + connection.vendor)
+
+        results = {}
+        for name in options['profiles'].split(','):
+            if name not in PROFILES:
+                raise CommandError(f"Unknown profile {name}; choose from {', '.join(PROFILES)}")
+            # New connections pick up the profile's PRAGMAs
+            connections.close_all()
+            with override_settings(FILES_SQLITE_PRAGMAS=PROFILES[name]), isolated_environment():
+                seed_files(options['seed'])
+                results[name] = read_write_workload(options['readers'], options['writers'], options['duration'])
+            connections.close_all()
+
+            for kind, result in results[name].items():
+                latency = f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms" if result['count'] else "no completed operations"
+                self.stdout.write(
+                    f"{name:>8} {kind:>5}: {result['per_second']:8.1f}/s  {latency}  errors {result['errors']}"
+                )
+
+        if 'rollback' in results and 'tuned' in results:
+            for kind in ('read', 'write'):
+                before, after = results['rollback'][kind]['per_second'], results['tuned'][kind]['per_second']
+                change = f"{after / before:.2f}x" if before else "n/a"
+                self.stdout.write(f"{kind} throughput, tuned vs rollback: {change}")
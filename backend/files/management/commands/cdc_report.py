@@ -0,0 +1,82 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Sum
+
+from files.chunking import get_setting, iter_chunks
+from files.models import Chunk, File, FileChunk
+
+
+def ratio(logical, stored):
+    return f"{logical / stored:.2f}x" if stored else "n/a"
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the dedup ratio of the chunk store, or with --analyze estimate what content-defined "
+        "chunking would save on the files currently stored whole"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help="Chunk stored whole-file blobs in memory and report, without storing anything")
+        parser.add_argument('--avg-sizes', default='', help="Comma-separated average chunk sizes for --analyze (default: FILES_CHUNKING AVG_SIZE)")
+        parser.add_argument('--limit', type=int, default=0, help="Analyze at most this many files (0 = all)")
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            self.analyze(options)
+        else:
+            self.report_store()
+
+    def report_store(self):
+        files = File.objects.filter(is_reference=False, is_chunked=True).aggregate(
+            count=Count('id'), stored=Sum('size'), logical=Sum(F('size') * F('reference_count')),
+        )
+        chunks = Chunk.objects.aggregate(count=Count('id'), stored=Sum('size'))
+        manifest_entries = FileChunk.objects.count()
+        file_bytes, logical_bytes = files['stored'] or 0, files['logical'] or 0
+        chunk_bytes = chunks['stored'] or 0
+        self.stdout.write(f"Chunked files:        {files['count'] or 0} ({file_bytes} bytes, {logical_bytes} bytes with references)")
+        self.stdout.write(f"Chunks:               {chunks['count'] or 0} distinct of {manifest_entries} manifest entries")
+        self.stdout.write(f"Chunk store:          {chunk_bytes} bytes")
+        self.stdout.write(f"Sub-file dedup ratio: {ratio(file_bytes, chunk_bytes)} (distinct files vs. chunk store)")
+        self.stdout.write(f"Overall dedup ratio:  {ratio(logical_bytes, chunk_bytes)} (uploaded bytes vs. chunk store)")
+
+    def analyze(self, options):
+        avg_sizes = [int(size) for size in options['avg_sizes'].split(',') if size] or [get_setting('AVG_SIZE')]
+        rows = (
+            File.objects.filter(is_reference=False, is_chunked=False)
+            .exclude(file='')
+            .order_by('uploaded_at')
+            .values_list('file', 'size', 'reference_count')
+        )
+        if options['limit']:
+            rows = rows[:options['limit']]
+
+        seen = {avg_size: set() for avg_size in avg_sizes}
+        unique_bytes = dict.fromkeys(avg_sizes, 0)
+        files = whole_bytes = logical_bytes = 0
+        for name, size, reference_count in rows.iterator():
+            field_file = File._meta.get_field('file').storage.open(name, 'rb')
+            try:
+                for avg_size in avg_sizes:
+                    for _, data in iter_chunks(field_file, avg_size=avg_size):
+                        digest = hashlib.sha256(data).digest()
+                        if digest not in seen[avg_size]:
+                            seen[avg_size].add(digest)
+                            unique_bytes[avg_size] += len(data)
+            finally:
+                field_file.close()
+            files += 1
+            whole_bytes += size
+            logical_bytes += size * reference_count
+
+        self.stdout.write(f"Analyzed {files} stored files: {logical_bytes} bytes uploaded, {whole_bytes} bytes stored whole")
+        self.stdout.write(f"Whole-file dedup ratio: {ratio(logical_bytes, whole_bytes)}")
+        for avg_size in avg_sizes:
+            stored = unique_bytes[avg_size]
+            self.stdout.write(
+                f"avg {avg_size:>7} B: {len(seen[avg_size])} distinct chunks, {stored} bytes; "
+                f"saves {whole_bytes - stored} bytes over whole-file dedup, "
+                f"overall ratio {ratio(logical_bytes, stored)}"
+            )
@@ -0,0 +1,195 @@
+import os
+import time
+import uuid
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from files.chunking import remove_chunk_blobs
+from files.models import Chunk, File, IngestJob, UploadSession
+from files.services import remove_blobs
+from files.storage import CAS_PREFIX, CHUNK_PREFIX, get_blob_storage
+
+logger = logging.getLogger(__name__)
+
+# Only these directories hold blobs; anything else under MEDIA_ROOT is left alone
+BLOB_PREFIXES = (CAS_PREFIX, 'uploads', CHUNK_PREFIX)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile blob storage with the database: find blobs no File row points at, rows whose "
+        "blob is missing and abandoned staging files. Reports only, unless --delete/--prune-rows is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help="Delete orphaned blobs and stale staging files")
+        parser.add_argument('--prune-rows', action='store_true', help="Delete File rows whose blob is missing")
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help="Ignore files modified less than this many seconds ago, so in-flight uploads are never touched"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Names checked per database query")
+        parser.add_argument('--max-rate', type=float, default=0, help="Maximum entries examined per second (0 = unlimited)")
+        parser.add_argument('--progress-interval', type=float, default=10, help="Seconds between progress lines")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.storage = get_blob_storage()
+        self.cutoff = time.time() - options['min_age']
+        self.stats = Counter()
+        self.started = self.last_progress = time.monotonic()
+
+        self.scan_blobs()
+        self.scan_rows()
+        self.scan_staging()
+        self.progress(force=True)
+
+        prefix = "" if options['delete'] or options['prune_rows'] else "[dry run] "
+        stats = self.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Scanned {stats['blobs']} blobs and {stats['rows']} rows: "
+            f"{stats['orphans']} orphaned blobs ({stats['orphan_bytes']} bytes), {stats['removed']} removed; "
+            f"{stats['recent']} too recent to judge; "
+            f"{stats['dangling']} rows without a blob, {stats['pruned']} pruned; "
+            f"{stats['stale_staging']} stale staging files, {stats['staging_removed']} removed"
+        ))
+
+    def walk(self, path):
+        """Yield every regular file below ``path`` with os.scandir, without building the whole listing"""
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry
+            except FileNotFoundError:
+                continue
+
+    def scan_blobs(self):
+        batch = []
+        for prefix in BLOB_PREFIXES:
+            for entry in self.walk(self.storage.path(prefix)):
+                name = os.path.relpath(entry.path, self.storage.location).replace(os.sep, '/')
+                batch.append((name, entry.stat(follow_symlinks=False)))
+                if len(batch) >= self.options['batch_size']:
+                    self.check_blobs(batch)
+                    batch = []
+        if batch:
+            self.check_blobs(batch)
+
+    def check_blobs(self, batch):
+        names = [name for name, _ in batch]
+        in_use = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+        # Chunk blobs are named after their digest and belong to Chunk rows instead
+        chunk_names = {os.path.basename(name): name for name in names if name.startswith(f'{CHUNK_PREFIX}/')}
+        in_use.update(
+            chunk_names[digest] for digest in Chunk.objects.filter(hash__in=list(chunk_names)).values_list('hash', flat=True)
+        )
+        orphans = []
+        for name, stat in batch:
+            if name in in_use:
+                continue
+            if stat.st_mtime > self.cutoff:
+                # Possibly written by an upload whose row is not committed yet
+                self.stats['recent'] += 1
+                continue
+            self.stats['orphans'] += 1
+            self.stats['orphan_bytes'] += stat.st_size
+            orphans.append(name)
+            if self.options['verbosity'] >= 2:
+                self.stdout.write(f"Orphaned blob: {name}")
+        if orphans and self.options['delete']:
+            # Both check the names against the database again right before deleting
+            chunk_orphans = [name for name in orphans if name.startswith(f'{CHUNK_PREFIX}/')]
+            file_orphans = [name for name in orphans if not name.startswith(f'{CHUNK_PREFIX}/')]
+            self.stats['removed'] += remove_blobs(file_orphans) + remove_chunk_blobs(chunk_orphans)
+        self.stats['blobs'] += len(batch)
+        self.throttle()
+
+    def scan_rows(self):
+        # Fetched a batch at a time by id, so no cursor over the table is open while rows are pruned
+        rows = File.objects.exclude(file='').order_by('id').values_list('id', 'file')
+        last_id = None
+        while True:
+            batch = rows.filter(id__gt=last_id) if last_id is not None else rows
+            batch = list(batch[:self.options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            dangling = []
+            for file_id, name in batch:
+                self.stats['rows'] += 1
+                if not os.path.exists(self.storage.path(name)):
+                    self.stats['dangling'] += 1
+                    dangling.append(file_id)
+                    if self.options['verbosity'] >= 2:
+                        self.stdout.write(f"Row {file_id} points at missing blob {name}")
+            self.prune(dangling)
+            self.throttle()
+
+    def prune(self, file_ids):
+        if file_ids and self.options['prune_rows']:
+            self.stats['pruned'] += File.objects.filter(pk__in=file_ids).delete()[1].get(File._meta.label, 0)
+            logger.info(f"Pruned {len(file_ids)} rows whose blob is missing")
+
+    def scan_staging(self):
+        """Leftovers of crashed uploads: temp files, and staged bytes of sessions or jobs that are gone"""
+        staging_dirs = {settings.FILE_UPLOAD_TEMP_DIR, self.storage.path(self.storage.staging_dirname)}
+        for staging_dir in filter(None, staging_dirs):
+            for entry in self.walk(staging_dir):
+                if entry.stat(follow_symlinks=False).st_mtime > self.cutoff:
+                    continue
+                if entry.name.endswith('.part') and self.session_exists(entry.name[:-len('.part')]):
+                    continue
+                if entry.name.endswith('.job') and self.job_pending(entry.name[:-len('.job')]):
+                    continue
+                self.stats['stale_staging'] += 1
+                if self.options['verbosity'] >= 2:
+                    self.stdout.write(f"Stale staging file: {entry.path}")
+                if self.options['delete']:
+                    try:
+                        os.remove(entry.path)
+                        self.stats['staging_removed'] += 1
+                    except OSError as e:
+                        logger.warning(f"Could not remove staging file {entry.path}: {e}")
+
+    def session_exists(self, session_id):
+        try:
+            return UploadSession.objects.filter(pk=uuid.UUID(session_id)).exists()
+        except ValueError:
+            return False
+
+    def job_pending(self, job_id):
+        try:
+            return IngestJob.objects.filter(
+                pk=uuid.UUID(job_id), status__in=[IngestJob.QUEUED, IngestJob.RUNNING]
+            ).exists()
+        except ValueError:
+            return False
+
+    def throttle(self):
+        """Sleep as needed to stay under --max-rate, then report progress"""
+        max_rate = self.options['max_rate']
+        if max_rate > 0:
+            behind = (self.stats['blobs'] + self.stats['rows']) / max_rate - (time.monotonic() - self.started)
+            if behind > 0:
+                time.sleep(behind)
+        self.progress()
+
+    def progress(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_progress < self.options['progress_interval']:
+            return
+        self.last_progress = now
+        elapsed = max(now - self.started, 1e-9)
+        examined = self.stats['blobs'] + self.stats['rows']
+        self.stderr.write(
+            f"[{elapsed:.0f}s] {self.stats['blobs']} blobs, {self.stats['rows']} rows "
+            f"({examined / elapsed:.0f}/s); {self.stats['orphans']} orphans, {self.stats['dangling']} dangling rows"
+        )
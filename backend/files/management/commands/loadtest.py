@@ -0,0 +1,105 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from files.benchmarking import summarize
+
+
+async def fetch(url, read_delay=0.0, read_size=64 * 1024):
+    """GET ``url`` over a fresh HTTP/1.1 connection and return the status code.
+
+    With ``read_delay`` the body is read ``read_size`` bytes at a time with a
+    pause in between, like a client on a slow link.
+    """
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        while True:
+            data = await reader.read(read_size)
+            if not data:
+                break
+            if read_delay:
+                await asyncio.sleep(read_delay)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a running server: many concurrent GETs of --url, optionally while --slow-clients "
+        "download --slow-url at a trickle. Run it against gunicorn (WSGI) and uvicorn (ASGI) to compare"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True, help="URL measured, e.g. http://127.0.0.1:8000/api/files/")
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--slow-url', help="URL the slow clients download, e.g. a large file's download/ URL")
+        parser.add_argument('--slow-clients', type=int, default=0)
+        parser.add_argument('--slow-read-delay', type=float, default=0.5, help="Seconds a slow client waits between reads")
+        parser.add_argument('--slow-read-size', type=int, default=16 * 1024, help="Bytes a slow client reads at a time")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+
+    def handle(self, *args, **options):
+        if options['slow_clients'] and not options['slow_url']:
+            raise CommandError("--slow-clients needs --slow-url")
+        result = asyncio.run(self.run(options))
+        latency = result['latency']
+        self.stdout.write(
+            f"{result['completed']} requests in {result['elapsed']:.2f}s ({result['completed'] / result['elapsed']:.0f} req/s), "
+            f"{result['errors']} errors, concurrency {options['concurrency']}, {options['slow_clients']} slow clients"
+        )
+        if latency:
+            self.stdout.write(
+                f"latency p50 {latency['p50_ms']:.1f} ms  p95 {latency['p95_ms']:.1f} ms  "
+                f"p99 {latency['p99_ms']:.1f} ms  max {latency['max_ms']:.1f} ms"
+            )
+
+    async def run(self, options):
+        slow_tasks = [
+            asyncio.create_task(fetch(options['slow_url'], options['slow_read_delay'], options['slow_read_size']))
+            for _ in range(options['slow_clients'])
+        ]
+        # Give the slow downloads time to occupy the server before measuring
+        if slow_tasks:
+            await asyncio.sleep(1)
+
+        durations = []
+        errors = 0
+        remaining = options['requests']
+
+        async def client():
+            nonlocal errors, remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    status_code = await asyncio.wait_for(fetch(options['url']), options['timeout'])
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    errors += 1
+                    continue
+                if status_code >= 400:
+                    errors += 1
+                    continue
+                durations.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        for task in slow_tasks:
+            task.cancel()
+        await asyncio.gather(*slow_tasks, return_exceptions=True)
+        return {
+            'completed': len(durations),
+            'errors': errors,
+            'elapsed': elapsed,
+            'latency': summarize(durations) if durations else None,
+        }
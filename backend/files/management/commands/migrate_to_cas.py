@@ -0,0 +1,74 @@
+import os
+import logging
+
+from django.core.files import File as DjangoFile
+from django.core.management.base import BaseCommand
+
+from files.cache import bump_generation, invalidate_files
+from files.models import File
+from files.storage import CAS_PREFIX, content_addressed_name, get_blob_storage
+from files.utils import compute_file_hash
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Move blobs stored under uploads/ into the content-addressed cas/ab/cd/<sha256> layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be moved without touching anything")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = get_blob_storage()
+        rows = (
+            File.objects.filter(is_reference=False)
+            .exclude(file='')
+            .exclude(file__startswith=f'{CAS_PREFIX}/')
+            .values_list('id', 'file', 'hash')
+        )
+        moved = deduplicated = missing = mismatched = 0
+
+        for file_id, old_name, expected_hash in rows.iterator(chunk_size=options['batch_size']):
+            old_path = storage.path(old_name)
+            if not os.path.exists(old_path):
+                self.stderr.write(f"Missing blob for file {file_id}: {old_name}")
+                missing += 1
+                continue
+
+            # Re-hash from disk: the new path must be derived from the bytes actually stored
+            with open(old_path, 'rb') as blob:
+                digest = compute_file_hash(DjangoFile(blob))
+            if digest != expected_hash:
+                self.stderr.write(f"Hash mismatch for file {file_id}: stored {expected_hash}, on disk {digest}; skipping")
+                mismatched += 1
+                continue
+
+            new_name = content_addressed_name(digest)
+            new_path = storage.path(new_name)
+            if dry_run:
+                self.stdout.write(f"Would move {old_name} -> {new_name}")
+                moved += 1
+                continue
+
+            if os.path.exists(new_path):
+                os.remove(old_path)
+                deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.replace(old_path, new_path)
+                moved += 1
+            File.objects.filter(file=old_name).update(file=new_name)
+            invalidate_files()
+            logger.info(f"Moved blob for file {file_id} from {old_name} to {new_name}")
+
+        if not dry_run and moved + deduplicated:
+            # A reader that loaded a row before it moved may have cached it under the
+            # last per-row generation; a final bump drops anything naming an old path
+            bump_generation()
+
+        prefix = "[dry run] " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Moved {moved}, deduplicated {deduplicated}, missing {missing}, hash mismatches {mismatched}"
+        ))
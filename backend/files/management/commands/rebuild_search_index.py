@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from files.search import fts_available, install_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the filename search index and re-index every file (run after VACUUM on SQLite)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        install_search_index(connection, rebuild=True)
+        if connection.vendor == 'sqlite' and not fts_available(connection.alias):
+            self.stdout.write(self.style.WARNING("FTS5 trigram search is unavailable; search uses LIKE scans"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt on {connection.vendor}"))
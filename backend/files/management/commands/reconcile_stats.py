@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from files.stats import compute_stats, current_stats, rebuild_stats, stats_drift
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-type storage stats from the files table and report any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without rewriting the table")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            drift = stats_drift(current_stats(), compute_stats())
+        else:
+            drift = rebuild_stats()
+
+        for file_type, differences in sorted(drift.items()):
+            details = ', '.join(f"{field} {value:+d}" for field, value in differences.items())
+            self.stdout.write(f"{file_type or '(empty)'}: recorded {details} against actual")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Stats match the files table"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Drift in {len(drift)} file types; run without --dry-run to fix"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt stats, correcting drift in {len(drift)} file types"))
@@ -0,0 +1,249 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from files.benchmarking import (
+    isolated_environment,
+    parse_distribution,
+    seed_files,
+    summarize,
+    synthetic_content,
+    upload_plan,
+)
+from files.cache import bump_generation
+from files.utils import compute_file_hash
+
+SUITES = ('hash', 'upload', 'delete', 'list')
+SEED_FILE_TYPES = ('text/plain', 'image/png', 'application/pdf', 'application/json', 'video/mp4')
+# List requests measured at every table size; cursor pages need no COUNT, so depth does not matter
+LIST_QUERIES = {
+    'list': {},
+    'list_page_100': {'page_size': 100},
+    'filter_type': {'file_type': 'application/pdf'},
+    'filter_size': {'min_size': 5000, 'max_size': 6000},
+    'filter_reference': {'is_reference': 'true'},
+    'search': {'search': 'file-1234'},
+    'filename_contains': {'original_filename__icontains': '-99'},
+    'order_size': {'ordering': '-size'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark uploads, duplicate uploads, deletes, hashing and list/filter/search latency "
+        "through the API on a throwaway database, and write the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suites', default=','.join(SUITES), help="Comma-separated suites to run")
+        parser.add_argument('--uploads', type=int, default=200, help="Uploads in the upload suite")
+        parser.add_argument('--duplicate-ratio', type=float, default=0.3, help="Share of uploads repeating earlier content")
+        parser.add_argument(
+            '--sizes', default='4096:60,65536:30,1048576:10',
+            help="Upload size distribution as size:weight pairs, in bytes"
+        )
+        parser.add_argument('--rows', default='10000,100000,1000000', help="Comma-separated table sizes for the list suite")
+        parser.add_argument('--reference-ratio', type=float, default=0.3, help="Share of seeded rows that are references")
+        parser.add_argument('--repeat', type=int, default=30, help="Requests per list query and cache state")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for upload sizes, duplicates and content")
+        parser.add_argument('--output', help="JSON file to write (default: benchmark-<UTC time>.json)")
+        parser.add_argument('--compare', help="Earlier results JSON to print p50 and throughput changes against")
+
+    def handle(self, *args, **options):
+        suites = options['suites'].split(',')
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            raise CommandError(f"Unknown suites {', '.join(sorted(unknown))}; choose from {', '.join(SUITES)}")
+        self.options = options
+        self.sizes, self.weights = parse_distribution(options['sizes'])
+        results = {'meta': self.metadata(suites)}
+
+        with isolated_environment():
+            self.client = Client()
+            if 'hash' in suites:
+                results['hash'] = self.hash_suite()
+            if 'upload' in suites or 'delete' in suites:
+                uploaded, results['upload'] = self.upload_suite()
+                if 'delete' in suites:
+                    results['delete'] = self.delete_suite(uploaded)
+                if 'upload' not in suites:
+                    del results['upload']
+            if 'list' in suites:
+                results['list'] = self.list_suite()
+
+        output = options['output'] or f"benchmark-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+        with open(output, 'w') as stream:
+            json.dump(results, stream, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+        if options['compare']:
+            with open(options['compare']) as stream:
+                self.compare(json.load(stream), results)
+
+    def metadata(self, suites):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        options = {name: self.options[name] for name in (
+            'uploads', 'duplicate_ratio', 'sizes', 'rows', 'reference_ratio', 'repeat', 'seed'
+        )}
+        return {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'suites': suites,
+            'options': options,
+        }
+
+    def hash_suite(self):
+        """compute_file_hash throughput per upload size"""
+        results = {}
+        for size in self.sizes:
+            content = ContentFile(synthetic_content('hash', size, self.options['seed']), name='sample.bin')
+            repeat = max(3, min(100, (64 * 1024 * 1024) // size))
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                compute_file_hash(content)
+                durations.append(time.perf_counter() - start)
+            results[str(size)] = {**summarize(durations), 'mb_per_second': size / min(durations) / 1e6}
+            self.stdout.write(f"hash {size:>10} B: {results[str(size)]['mb_per_second']:9.1f} MB/s")
+        return results
+
+    def upload_suite(self):
+        """POST /api/files/ for every planned upload; duplicates become references"""
+        plan = upload_plan(
+            self.options['uploads'], self.options['duplicate_ratio'], self.sizes, self.weights, self.options['seed']
+        )
+        durations = {'new': [], 'duplicate': []}
+        uploaded, total_bytes = [], 0
+        started = time.perf_counter()
+        for content_id, size in plan:
+            content = synthetic_content(content_id, size, self.options['seed'])
+            upload = ContentFile(content, name=f"upload-{content_id}.bin")
+            start = time.perf_counter()
+            response = self.client.post('/api/files/', {'file': upload})
+            elapsed = time.perf_counter() - start
+            if response.status_code not in (200, 201):
+                raise CommandError(f"Upload failed with {response.status_code}: {response.content[:200]!r}")
+            created = response.status_code == 201
+            body = response.json()
+            # Duplicates answer with the stored file under 'file'
+            uploaded.append(body['id'] if created else body['file']['id'])
+            durations['new' if created else 'duplicate'].append(elapsed)
+            total_bytes += size
+        elapsed = time.perf_counter() - started
+
+        results = {
+            'files': len(plan),
+            'bytes': total_bytes,
+            'seconds': elapsed,
+            'files_per_second': len(plan) / elapsed,
+            'mb_per_second': total_bytes / elapsed / 1e6,
+        }
+        for kind, values in durations.items():
+            results[kind] = summarize(values) if values else {'count': 0}
+        self.stdout.write(
+            f"upload: {results['files_per_second']:.1f} files/s, {results['mb_per_second']:.1f} MB/s; "
+            f"new p50 {results['new'].get('p50_ms', 0):.2f} ms, "
+            f"duplicate p50 {results['duplicate'].get('p50_ms', 0):.2f} ms"
+        )
+        return uploaded, results
+
+    def delete_suite(self, uploaded):
+        """DELETE every uploaded file once, releasing references until the rows go"""
+        durations = []
+        started = time.perf_counter()
+        for file_id in uploaded:
+            start = time.perf_counter()
+            response = self.client.delete(f'/api/files/{file_id}/')
+            durations.append(time.perf_counter() - start)
+            # 200 while references remain, 204 once the row is gone
+            if response.status_code not in (200, 204):
+                raise CommandError(f"Delete of {file_id} failed with {response.status_code}")
+        elapsed = time.perf_counter() - started
+        results = {**summarize(durations), 'files_per_second': len(uploaded) / elapsed} if uploaded else {'count': 0}
+        self.stdout.write(f"delete: {results.get('files_per_second', 0):.1f} files/s")
+        return results
+
+    def list_suite(self):
+        """Latency of each list query at growing table sizes, with a cold and a warm response cache"""
+        results = {}
+        rows = 0
+        for target in sorted(int(count) for count in self.options['rows'].split(',')):
+            started = time.perf_counter()
+            added = seed_files(
+                target - rows, reference_ratio=self.options['reference_ratio'], start=rows,
+                file_types=SEED_FILE_TYPES,
+            )
+            rows += added
+            seeded = time.perf_counter() - started
+            self.stdout.write(f"seeded {rows} rows ({added / max(seeded, 1e-9):.0f} rows/s)")
+            connection.close()  # Start with fresh connection state, as a new worker would
+
+            by_query = {}
+            for name, params in LIST_QUERIES.items():
+                by_query[name] = {
+                    # A new generation before each request means a cache miss every time
+                    'uncached': summarize(self.time_get(params, before=bump_generation)),
+                    'cached': summarize(self.time_get(params)),
+                }
+                self.stdout.write(
+                    f"{rows:>8} rows {name:>18}: uncached p50 {by_query[name]['uncached']['p50_ms']:8.2f} ms  "
+                    f"p95 {by_query[name]['uncached']['p95_ms']:8.2f} ms  "
+                    f"cached p50 {by_query[name]['cached']['p50_ms']:6.2f} ms"
+                )
+            results[str(rows)] = by_query
+        return results
+
+    def time_get(self, params, before=None):
+        durations = []
+        for _ in range(self.options['repeat']):
+            if before is not None:
+                before()
+            start = time.perf_counter()
+            response = self.client.get('/api/files/', params)
+            durations.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(f"GET /api/files/ {params} failed with {response.status_code}")
+        return durations
+
+    def compare(self, before, after):
+        """Print every p50 latency and throughput present in both runs, with the change"""
+        def metrics(tree, path=()):
+            for key, value in tree.items():
+                if key == 'meta':
+                    continue
+                if isinstance(value, dict):
+                    yield from metrics(value, path + (key,))
+                elif key in ('p50_ms', 'p95_ms', 'files_per_second', 'mb_per_second'):
+                    yield '.'.join(path + (key,)), value
+
+        old = dict(metrics(before))
+        commits = f"{before.get('meta', {}).get('commit')} -> {after['meta']['commit']}"
+        self.stdout.write(f"Compared with {self.options['compare']} ({commits}):")
+        for name, value in metrics(after):
+            if name not in old or not old[name]:
+                continue
+            ratio = value / old[name]
+            # Lower is better for latencies, higher for throughput
+            better = ratio < 1 if name.endswith('_ms') else ratio > 1
+            style = self.style.SUCCESS if better else self.style.WARNING
+            self.stdout.write(style(f"  {name}: {old[name]:.2f} -> {value:.2f} ({ratio:.2f}x)"))
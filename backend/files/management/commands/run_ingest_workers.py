@@ -0,0 +1,59 @@
+import os
+import socket
+import threading
+import logging
+
+from django.core.management.base import BaseCommand
+
+from files.ingest_jobs import requeue_stale, run_worker
+from files.models import IngestJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a pool of ingest workers that store uploads queued by POST /api/ingest/. "
+        "Several instances (on one or more hosts) can share the queue"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="Worker threads in this process")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds an idle worker waits before polling again")
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Seconds without a heartbeat after which a running job is assumed orphaned by a dead worker and requeued"
+        )
+        parser.add_argument('--drain', action='store_true', help="Exit once the queue is empty instead of waiting for more jobs")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        requeue_stale(options['stale_after'])
+        threads = [
+            threading.Thread(
+                target=run_worker,
+                args=(f"{prefix}:{index}", stop_event, options['poll_interval'], options['drain']),
+                name=f"ingest-worker-{index}",
+                daemon=True,
+            )
+            for index in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} ingest workers ({prefix})")
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=options['poll_interval'])
+                if not options['drain']:
+                    requeue_stale(options['stale_after'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers after their current job...")
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        remaining = IngestJob.objects.filter(status=IngestJob.QUEUED).count()
+        self.stdout.write(self.style.SUCCESS(f"Workers stopped, {remaining} jobs still queued"))
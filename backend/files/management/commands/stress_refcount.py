@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+import time
+import logging
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from files.models import File
+from files.services import ingest_upload, release_reference
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reference counting load against the configured database: many threads upload and then "
+        "delete the same content, and the final counts must add up exactly (files.tests runs a smaller version)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--iterations', type=int, default=20, help="Uploads (and later deletes) per thread")
+        parser.add_argument('--size', type=int, default=64 * 1024, help="Size of the shared test file in bytes")
+
+    def handle(self, *args, **options):
+        threads, iterations = options['threads'], options['iterations']
+        expected = threads * iterations
+        # Fresh random content so the run never collides with real files
+        content = os.urandom(options['size'])
+        file_hash = hashlib.sha256(content).hexdigest()
+        errors = []
+        created = []
+
+        def upload_worker():
+            try:
+                for _ in range(iterations):
+                    upload = SimpleUploadedFile('stress.bin', content, 'application/octet-stream')
+                    instance, was_created = ingest_upload(upload, file_hash, upload.name, upload.content_type, len(content))
+                    if was_created:
+                        created.append(instance.pk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        elapsed = self._run(upload_worker, threads)
+        rows = File.objects.filter(hash=file_hash, is_reference=False)
+        reference_count = sum(rows.values_list('reference_count', flat=True))
+        self.stdout.write(
+            f"Uploads: {expected} in {elapsed:.2f}s, rows created {len(created)}, "
+            f"reference_count {reference_count}, errors {len(errors)}"
+        )
+        failures = []
+        if errors:
+            failures.append(f"{len(errors)} uploads failed, first: {errors[0]!r}")
+        if len(created) != 1 or rows.count() != 1:
+            failures.append(f"expected exactly one stored row, created {len(created)}, found {rows.count()}")
+        if reference_count != expected:
+            failures.append(f"expected reference_count {expected}, got {reference_count} (lost updates)")
+
+        stored = rows.first()
+        if stored is not None:
+            blob_name = stored.file.name
+            deleted = []
+            errors.clear()
+
+            def delete_worker():
+                try:
+                    for _ in range(iterations):
+                        was_deleted, _ = release_reference(stored.pk)
+                        if was_deleted:
+                            deleted.append(True)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    connection.close()
+
+            elapsed = self._run(delete_worker, threads)
+            remaining = File.objects.filter(pk=stored.pk).exists()
+            self.stdout.write(f"Deletes: {expected} in {elapsed:.2f}s, row deleted {len(deleted)} time(s), errors {len(errors)}")
+            if errors:
+                failures.append(f"{len(errors)} deletes failed, first: {errors[0]!r}")
+            if len(deleted) != 1 or remaining:
+                failures.append(f"expected the row to be deleted exactly once, deleted {len(deleted)}, still present {remaining}")
+            if not remaining:
+                stored.file.storage.delete(blob_name)
+
+        if failures:
+            raise CommandError("; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Reference counts are consistent"))
+
+    def _run(self, target, count):
+        workers = [threading.Thread(target=target) for _ in range(count)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - start
@@ -0,0 +1,230 @@
+"""Prometheus metrics for the files app, and per-request phase timings.
+
+``metrics_middleware`` times every request by endpoint (the URL name) and
+counts the database queries it runs and their time. The hot paths record
+hashing, compression and storage writes through ``phase`` and
+``record_hashing``. With ``FILES_METRICS['SERVER_TIMING']`` on, each
+response gets a ``Server-Timing`` header with its phase breakdown. Phases
+can overlap (a storage write that has to hash includes that hashing).
+
+The metrics are served at ``/metrics`` in the Prometheus text format. With
+several worker processes, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory before they start so the endpoint reports all of them.
+"""
+import contextvars
+import ipaddress
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+DEFAULTS = {
+    'SERVER_TIMING': False,
+    # Networks allowed to read /metrics
+    'ALLOW_FROM': ['127.0.0.0/8', '::1/128'],
+}
+# Requests carrying file bytes, counted as in-flight uploads while they run
+UPLOAD_CONTENT_TYPES = ('multipart/form-data', 'application/octet-stream')
+
+REQUEST_LATENCY = Histogram(
+    'filehub_request_duration_seconds', "Time until the view returns a response, by endpoint",
+    ['endpoint', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'filehub_request_db_queries', "Database queries per request, by endpoint",
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+)
+REQUEST_DB_TIME = Histogram(
+    'filehub_request_db_seconds', "Time spent in database queries per request, by endpoint", ['endpoint'],
+)
+HASH_BYTES = Counter('filehub_hash_bytes', "Bytes fed to SHA-256", ['source'])
+HASH_SECONDS = Counter('filehub_hash_seconds', "Seconds spent in SHA-256 updates", ['source'])
+COMPRESS_SECONDS = Histogram('filehub_compress_seconds', "Time to compress a blob before storing it", ['codec'])
+STORAGE_WRITE_SECONDS = Histogram(
+    'filehub_storage_write_seconds', "Time to write a blob or chunk into storage", ['kind'],
+)
+DEDUP_UPLOADS = Counter(
+    'filehub_dedup_uploads', "Uploads stored as new content or referenced as duplicates", ['result'],
+)
+UPLOADS_IN_PROGRESS = Gauge(
+    'filehub_uploads_in_progress', "Upload requests being received or processed", multiprocess_mode='livesum',
+)
+REFCOUNT_CONFLICTS = Counter(
+    'filehub_refcount_conflicts', "Concurrent changes ingest had to recover from, by kind", ['kind'],
+)
+
+_timings = contextvars.ContextVar('filehub_request_timings', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'FILES_METRICS', {}).get(name, DEFAULTS[name])
+
+
+class RequestTimings:
+    """Seconds per phase and the query count of one request"""
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+
+    def server_timing(self, total):
+        entries = []
+        for name, seconds in self.phases.items():
+            entry = f"{name};dur={seconds * 1000:.2f}"
+            if name == 'db':
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ', '.join(entries)
+
+
+def record_phase(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings.phases[name] += seconds
+
+
+@contextmanager
+def phase(name, histogram=None):
+    """Time a block into the current request's ``name`` phase and, optionally, a labelled histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        record_phase(name, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed)
+
+
+def record_hashing(source, size, seconds):
+    HASH_BYTES.labels(source).inc(size)
+    HASH_SECONDS.labels(source).inc(seconds)
+    record_phase('hash', seconds)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper counting the queries and query time of the request being served"""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.phases['db'] += time.perf_counter() - start
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver installing time_query on every new connection"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class HashFilterCollector:
+    """Exposes the counters the dedup hash filter keeps anyway, read at scrape time"""
+
+    def families(self, stats=None):
+        lookups = CounterMetricFamily(
+            'filehub_hash_filter_lookups', "Dedup hash filter answers in this process", labels=['answer'],
+        )
+        false_positives = CounterMetricFamily(
+            'filehub_hash_filter_false_positives', "Positive filter answers the database lookup did not confirm",
+        )
+        size = GaugeMetricFamily('filehub_hash_filter_bytes', "Size of the hash filter's bit array")
+        if stats is not None:
+            lookups.add_metric(['negative'], stats['negatives'])
+            lookups.add_metric(['positive'], stats['positives'])
+            false_positives.add_metric([], stats['false_positives'])
+            size.add_metric([], stats['bytes'])
+        return [lookups, false_positives, size]
+
+    def describe(self):
+        # Lets the registry check names at import time, before the models can be loaded
+        return self.families()
+
+    def collect(self):
+        from .hash_filter import hash_filter
+        return self.families(hash_filter.stats())
+
+
+REGISTRY.register(HashFilterCollector())
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # Unmatched paths share one label so scanners cannot blow up the label set
+    return match.view_name if match else 'unmatched'
+
+
+class RequestObservation:
+    def __init__(self, request):
+        self.request = request
+        self.start = time.perf_counter()
+        self.timings = RequestTimings()
+        self.token = _timings.set(self.timings)
+        self.upload = request.method in ('POST', 'PUT', 'PATCH') and request.content_type in UPLOAD_CONTENT_TYPES
+        if self.upload:
+            UPLOADS_IN_PROGRESS.inc()
+
+    def finish(self, response):
+        total = time.perf_counter() - self.start
+        endpoint = endpoint_name(self.request)
+        REQUEST_LATENCY.labels(endpoint, self.request.method, str(response.status_code)).observe(total)
+        REQUEST_QUERIES.labels(endpoint).observe(self.timings.queries)
+        REQUEST_DB_TIME.labels(endpoint).observe(self.timings.phases['db'])
+        if get_setting('SERVER_TIMING'):
+            response['Server-Timing'] = self.timings.server_timing(total)
+
+    def close(self):
+        if self.upload:
+            UPLOADS_IN_PROGRESS.dec()
+        _timings.reset(self.token)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Request latency, query counts and in-flight uploads, plus Server-Timing in debug mode"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            observation = RequestObservation(request)
+            try:
+                response = await get_response(request)
+                observation.finish(response)
+                return response
+            finally:
+                observation.close()
+    else:
+        def middleware(request):
+            observation = RequestObservation(request)
+            try:
+                response = get_response(request)
+                observation.finish(response)
+                return response
+            finally:
+                observation.close()
+    return middleware
+
+
+def allowed_to_scrape(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network.strip()) for network in get_setting('ALLOW_FROM'))
+
+
+def render_metrics():
+    """The current metrics in the Prometheus text format, merged across processes when configured"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
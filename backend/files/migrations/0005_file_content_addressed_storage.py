@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:38
+
+import files.models
+import files.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_alter_file_file_type_alter_file_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(storage=files.storage.get_blob_storage, upload_to=files.models.file_upload_path),
+        ),
+    ]
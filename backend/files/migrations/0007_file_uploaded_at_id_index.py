@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['uploaded_at', 'id'], name='files_file_uploade_964dac_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:02
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def populate_stats(apps, schema_editor):
+    File = apps.get_model('files', 'File')
+    FileTypeStats = apps.get_model('files', 'FileTypeStats')
+    rows = (
+        File.objects.using(schema_editor.connection.alias)
+        .filter(is_reference=False)
+        .values('file_type')
+        .annotate(
+            unique_blobs=Count('id'),
+            total_files=Sum('reference_count'),
+            stored_bytes=Sum('size'),
+            logical_bytes=Sum(F('size') * F('reference_count')),
+        )
+        .order_by()
+    )
+    FileTypeStats.objects.using(schema_editor.connection.alias).bulk_create(
+        FileTypeStats(
+            file_type=row['file_type'],
+            unique_blobs=row['unique_blobs'],
+            total_files=row['total_files'] or 0,
+            stored_bytes=row['stored_bytes'] or 0,
+            logical_bytes=row['logical_bytes'] or 0,
+        )
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileTypeStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_type', models.CharField(max_length=100, unique=True)),
+                ('unique_blobs', models.BigIntegerField(default=0)),
+                ('total_files', models.BigIntegerField(default=0)),
+                ('stored_bytes', models.BigIntegerField(default=0)),
+                ('logical_bytes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
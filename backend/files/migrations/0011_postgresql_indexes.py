@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# PostgreSQL-only partial and covering indexes; SQLite keeps the indexes declared on the model
+INDEXES = {
+    # Dedup lookups (upload, check, batch) only ever look for stored copies; INCLUDE
+    # lets the size guard and existence checks answer from the index alone
+    'files_file_stored_hash_idx': '(hash) INCLUDE (size, reference_count) WHERE NOT is_reference',
+    # Newest-first pages filtered by type: one range scan in the cursor's (uploaded_at, id) order
+    'files_file_type_recent_idx': '(file_type, uploaded_at DESC, id DESC)',
+    # reconcile_stats and the stats migration aggregate these columns with an index-only scan
+    'files_file_type_totals_idx': '(file_type) INCLUDE (size, reference_count) WHERE NOT is_reference',
+    # Blob-in-use checks after deletes and in gc_blobs (file__in); rows without a blob are left out
+    'files_file_blob_idx': "(file) WHERE file <> ''",
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, definition in INDEXES.items():
+        # CONCURRENTLY keeps uploads flowing while a large table is indexed
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON files_file {definition}')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('files', '0010_filetypestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# FileFilter matches file_type case-insensitively (file_type__iexact compiles to
+# UPPER("file_type"::text) = UPPER(%s)), so the type index must be on the same expression
+TYPE_INDEX = ('files_file_type_upper_recent_idx', '(UPPER(file_type::text), uploaded_at DESC, id DESC)')
+# Replaced by TYPE_INDEX, and a duplicate of unique_hash_for_non_reference: every hash
+# lookup also filters on is_reference=False and loads the whole row, so INCLUDE never
+# gave an index-only scan
+DROPPED = {
+    'files_file_type_recent_idx': '(file_type, uploaded_at DESC, id DESC)',
+    'files_file_stored_hash_idx': '(hash) INCLUDE (size, reference_count) WHERE NOT is_reference',
+}
+
+
+def fix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    name, definition = TYPE_INDEX
+    schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON files_file {definition}')
+    for name in DROPPED:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+def restore_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, definition in DROPPED.items():
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON files_file {definition}')
+    schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {TYPE_INDEX[0]}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('files', '0014_ingestjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_indexes, restore_indexes),
+    ]
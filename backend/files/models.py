@@ -1,19 +1,23 @@
+from django.conf import settings
 from django.db import models
 import uuid
 import os
 import logging
+from .storage import content_addressed_name, get_blob_storage
 
 logger = logging.getLogger(__name__)
 
 def file_upload_path(instance, filename):
-    """Generate file path for new file upload"""
+    """Generate file path for new file upload, addressed by content hash when it is known"""
+    if instance.hash:
+        return content_addressed_name(instance.hash, instance.codec)
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}.{ext}"
     return os.path.join('uploads', filename)
 
 class File(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    file = models.FileField(upload_to=file_upload_path)
+    file = models.FileField(upload_to=file_upload_path, storage=get_blob_storage)
     original_filename = models.CharField(max_length=255, db_index=True)
     file_type = models.CharField(max_length=100, db_index=True)
     size = models.BigIntegerField(db_index=True)
@@ -22,12 +26,19 @@ class File(models.Model):
     reference_count = models.PositiveIntegerField(default=1, db_index=True)
     is_reference = models.BooleanField(default=False, db_index=True)
     original_file = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='references')
+    # Stored as a manifest of content-defined chunks (FileChunk) instead of one blob
+    is_chunked = models.BooleanField(default=False)
+    # Compression at rest: '' for raw blobs, else the codec (files.compression)
+    codec = models.CharField(max_length=16, blank=True, default='')
+    # Bytes on disk; null means the same as ``size``
+    stored_size = models.BigIntegerField(null=True, blank=True)
     
     class Meta:
         ordering = ['-uploaded_at']
         indexes = [
             models.Index(fields=['file_type', 'size']),
             models.Index(fields=['uploaded_at', 'file_type']),
+            models.Index(fields=['uploaded_at', 'id']),
             models.Index(fields=['reference_count', 'is_reference']),
         ]
         constraints = [
@@ -41,10 +52,122 @@ class File(models.Model):
     def increment_reference_count(self):
         """Increment the reference count of the original file"""
         if self.is_reference and self.original_file:
+            from .services import increment_reference_count
             original_file = self.original_file
-            original_file.reference_count += 1
-            original_file.save()
+            original_file.reference_count = increment_reference_count(original_file.pk)
             logger.info(f"Incremented reference count for file {original_file.id} to {original_file.reference_count}")
     
     def __str__(self):
         return self.original_filename
+
+
+class UploadSession(models.Model):
+    """A resumable upload whose bytes arrive as sequential chunks"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @property
+    def staging_path(self):
+        """Path of the partially assembled upload"""
+        return os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'sessions', f"{self.id}.part")
+
+    @property
+    def is_complete(self):
+        return self.received == self.size
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.received}/{self.size})"
+
+
+class IngestJob(models.Model):
+    """An upload staged by the API and stored by a background worker"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    original_filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    # Filled in by the upload handlers when they hashed the bytes on receipt
+    hash = models.CharField(max_length=64, blank=True)
+    bytes_processed = models.BigIntegerField(default=0)
+    file = models.ForeignKey(File, null=True, blank=True, on_delete=models.SET_NULL, related_name='ingest_jobs')
+    created = models.BooleanField(null=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Bumped by the worker while it runs the job; a stale heartbeat means the worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    @property
+    def staging_path(self):
+        """Path of the staged upload waiting for a worker"""
+        return os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'jobs', f"{self.id}.job")
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.status})"
+
+
+class FileTypeStats(models.Model):
+    """Running storage totals per file type, kept current by every File mutation.
+
+    Only stored (non-reference) files are counted: ``total_files`` is the sum
+    of their reference counts, i.e. how many files users see.
+    """
+    file_type = models.CharField(max_length=100, unique=True)
+    unique_blobs = models.BigIntegerField(default=0)
+    total_files = models.BigIntegerField(default=0)
+    stored_bytes = models.BigIntegerField(default=0)
+    logical_bytes = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.file_type}: {self.unique_blobs} blobs, {self.total_files} files"
+
+
+class Chunk(models.Model):
+    """A piece of one or more chunked files, stored once under chunks/ab/cd/<sha256>.
+
+    ``reference_count`` is the number of FileChunk rows pointing at it; the
+    chunk and its blob are removed when it drops to zero.
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    size = models.PositiveIntegerField()
+    reference_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.hash} ({self.size} bytes, {self.reference_count} references)"
+
+
+class FileChunk(models.Model):
+    """One entry of a chunked file's manifest: the chunk stored at ``offset``"""
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='manifest')
+    chunk = models.ForeignKey(Chunk, on_delete=models.PROTECT, related_name='file_chunks')
+    offset = models.BigIntegerField()
+
+    class Meta:
+        ordering = ['offset']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'offset'], name='unique_chunk_offset_per_file'),
+        ]
@@ -0,0 +1,142 @@
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+def _reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class FileCursorPagination(CursorPagination):
+    """Keyset pagination over ``(<ordering field>, id)``.
+
+    DRF's CursorPagination positions on the first ordering field only and
+    skips ties with an OFFSET, which degrades on low-cardinality fields such
+    as ``reference_count``. Here the cursor holds both the ordering value and
+    the id of the last row, so every page is a single indexed range scan of
+    ``page_size + 1`` rows regardless of depth, and no COUNT is ever run.
+    """
+    ordering = ('-uploaded_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        fields = [field for field in ordering if field.lstrip('-') not in ('id', 'pk')]
+        if len(fields) > 1:
+            # The cursor only holds one field plus id, so further fields could not be resumed from
+            raise ValidationError({'ordering': "Only one ordering field is supported; ties are ordered by id"})
+        primary = ordering[0]
+        if primary.lstrip('-') in ('id', 'pk'):
+            return (primary,)
+        # id breaks ties so the cursor always identifies exactly one row
+        return (primary, '-id' if primary.startswith('-') else 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, fetching the page with async iteration"""
+        page_queryset = self.page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([row async for row in page_queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """The (unevaluated) queryset for the requested page, plus one row"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        query_ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*query_ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._after(self.cursor.position, query_ordering))
+
+        # One extra row tells us whether another page follows
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        reverse = bool(self.cursor and self.cursor.reverse)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+
+        if self.page:
+            self.previous_position = self._position(self.page[0])
+            self.next_position = self._position(self.page[-1])
+        else:
+            self.previous_position = self.next_position = self.cursor.position if self.cursor else None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.previous_position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        return super().encode_cursor(cursor._replace(position=json.dumps(cursor.position)))
+
+    def _position(self, row):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            values.append(value.isoformat() if isinstance(value, datetime) else str(value))
+        return values
+
+    def _after(self, position, ordering):
+        """Filter for rows strictly after ``position`` in ``ordering``.
+
+        ``field <= value`` leads the condition so the database can use the
+        field's index as a range scan before resolving ties on id.
+        """
+        if len(ordering) == 1:
+            field = ordering[0]
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            return Q(**{f'{field.lstrip("-")}__{lookup}': position[0]})
+
+        primary, tiebreak = ordering
+        primary_name, tiebreak_name = primary.lstrip('-'), tiebreak.lstrip('-')
+        if primary.startswith('-'):
+            bound, strict = 'lte', 'lt'
+        else:
+            bound, strict = 'gte', 'gt'
+        tiebreak_lookup = 'lt' if tiebreak.startswith('-') else 'gt'
+        return Q(**{f'{primary_name}__{bound}': position[0]}) & (
+            Q(**{f'{primary_name}__{strict}': position[0]})
+            | Q(**{f'{tiebreak_name}__{tiebreak_lookup}': position[1]})
+        )
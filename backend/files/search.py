@@ -0,0 +1,158 @@
+"""Indexed substring search over file names and types.
+
+On SQLite the searchable columns are mirrored into an FTS5 trigram table kept
+in sync by triggers on ``files_file``; on PostgreSQL, GIN trigram indexes
+match the expressions Django's ``icontains`` already emits.
+"""
+import logging
+
+from django.db import connections
+from django.db.models import IntegerField, Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'files_file_search'
+SEARCH_COLUMNS = ('original_filename', 'file_type')
+# The trigram tokenizer cannot match terms shorter than one trigram
+MIN_TERM_LENGTH = 3
+
+SQLITE_TRIGGERS = {
+    f'{SEARCH_TABLE}_ai': f"""
+        CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON files_file BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, original_filename, file_type)
+            VALUES (new.rowid, new.original_filename, new.file_type);
+        END
+    """,
+    f'{SEARCH_TABLE}_ad': f"""
+        CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON files_file BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_filename, file_type)
+            VALUES ('delete', old.rowid, old.original_filename, old.file_type);
+        END
+    """,
+    f'{SEARCH_TABLE}_au': f"""
+        CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF original_filename, file_type ON files_file BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_filename, file_type)
+            VALUES ('delete', old.rowid, old.original_filename, old.file_type);
+            INSERT INTO {SEARCH_TABLE}(rowid, original_filename, file_type)
+            VALUES (new.rowid, new.original_filename, new.file_type);
+        END
+    """,
+}
+
+POSTGRES_INDEXES = {
+    'files_file_filename_trgm': 'UPPER("original_filename"::text) gin_trgm_ops',
+    'files_file_file_type_trgm': 'UPPER("file_type"::text) gin_trgm_ops',
+}
+
+# Per-alias cache of whether the FTS table can be queried
+_available = {}
+
+
+def sqlite_supports_trigram(connection):
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.files_trigram_probe USING fts5(x, tokenize='trigram')")
+            cursor.execute("DROP TABLE temp.files_trigram_probe")
+        except Exception:
+            return False
+    return True
+
+
+def install_search_index(connection, rebuild=False):
+    """Create (or repair) the search index for this connection's database.
+
+    Safe to run repeatedly. On SQLite it also rebuilds the FTS table when its
+    triggers were missing, e.g. after a migration remade ``files_file`` (a
+    table remake drops triggers and may renumber rowids). VACUUM can renumber
+    rowids too, so run ``manage.py rebuild_search_index`` after one.
+    """
+    _available.pop(connection.alias, None)
+    if 'files_file' not in connection.introspection.table_names():
+        return
+    if connection.vendor == 'sqlite':
+        if not sqlite_supports_trigram(connection):
+            logger.warning("SQLite was built without FTS5 trigram support; search falls back to LIKE scans")
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                f"original_filename, file_type, content='files_file', content_rowid='rowid', tokenize='trigram')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'files_file'"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+            for name in missing:
+                cursor.execute(SQLITE_TRIGGERS[name])
+            if missing or rebuild:
+                cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+                logger.info(f"Installed search triggers {missing or 'none'} and rebuilt {SEARCH_TABLE}")
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                logger.warning("The pg_trgm extension is not available; search falls back to LIKE scans")
+                return
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for name, expression in POSTGRES_INDEXES.items():
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON files_file USING gin ({expression})')
+
+
+def uninstall_search_index(connection):
+    _available.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+        elif connection.vendor == 'postgresql':
+            for name in POSTGRES_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def fts_available(using='default'):
+    """Whether queries on this database should go through the SQLite FTS table"""
+    if using not in _available:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+                available = cursor.fetchone() is not None
+        _available[using] = available
+    return _available[using]
+
+
+def _match_expression(term, columns):
+    # A quoted FTS5 string is a phrase of consecutive trigrams, i.e. a substring match
+    phrase = '"' + term.replace('"', '""') + '"'
+    if tuple(columns) == SEARCH_COLUMNS:
+        return phrase
+    return '{' + ' '.join(columns) + '} : ' + phrase
+
+
+def contains_condition(term, columns=SEARCH_COLUMNS, using='default'):
+    """Case-insensitive "any of ``columns`` contains ``term``" as a Q object.
+
+    Uses the FTS index when it exists and the term is long enough; otherwise
+    the plain ``icontains`` lookups (which PostgreSQL's trigram indexes serve).
+    """
+    indexed = set(columns) <= set(SEARCH_COLUMNS)
+    if indexed and len(term) >= MIN_TERM_LENGTH and fts_available(using):
+        matches = RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            [_match_expression(term, columns)],
+        )
+        return Q(search_rowid__in=matches)
+    condition = Q()
+    for column in columns:
+        condition |= Q(**{f'{column}__icontains': term})
+    return condition
+
+
+def with_search_rowid(queryset):
+    """Expose ``files_file.rowid`` so contains_condition() can join against the FTS table"""
+    table = queryset.model._meta.db_table
+    return queryset.alias(search_rowid=RawSQL(f'"{table}"."rowid"', [], output_field=IntegerField()))
@@ -1,5 +1,7 @@
-from rest_framework import serializers
-from .models import File
+from django.utils.encoding import filepath_to_uri
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import File, IngestJob, UploadSession
 import logging
 
 logger = logging.getLogger(__name__)
@@ -53,9 +55,11 @@ class FileSerializer(serializers.ModelSerializer):
                 original_file_id = validated_data.pop('original_file')
                 original_file = File.objects.get(id=original_file_id)
                 validated_data['original_file'] = original_file
-                # Increment reference count
-                original_file.reference_count += 1
-                original_file.save()
+                # Increment reference count atomically in the database
+                from .services import increment_reference_count
+                original_file.reference_count = increment_reference_count(original_file.pk)
+                if original_file.reference_count is None:
+                    raise ValueError(f"File {original_file_id} was deleted before it could be referenced")
                 # Set is_reference to True
                 validated_data['is_reference'] = True
             else:
@@ -65,4 +69,118 @@ class FileSerializer(serializers.ModelSerializer):
             return super().create(validated_data)
         except Exception as e:
             logger.error(f"Error in serializer create: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            raise
+
+
+
+class FileListSerializer:
+    """Read-only fast path for file listings.
+
+    Serializes rows fetched with ``queryset.values(*FileListSerializer.values)``
+    into exactly the dicts FileSerializer produces (same keys, order and
+    rendered JSON), without building a model instance or a field tree per row.
+    """
+    values = (
+        'id', 'file', 'original_filename', 'file_type', 'size', 'uploaded_at',
+        'hash', 'reference_count', 'is_reference', 'original_file_id',
+        'original_file__original_filename', 'original_file__file_type', 'original_file__size',
+        'original_file__uploaded_at', 'original_file__hash', 'original_file__reference_count',
+    )
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+        # Resolve everything FileField/DateTimeField recompute per row exactly once
+        storage = File._meta.get_field('file').storage
+        request = self.context.get('request')
+        self._url_prefix = request.build_absolute_uri(storage.base_url) if request is not None else storage.base_url
+        self._timezone = serializers.DateTimeField().default_timezone()
+        self._iso_datetimes = api_settings.DATETIME_FORMAT.lower() == ISO_8601
+
+    @property
+    def data(self):
+        return [self.to_representation(row) for row in self.rows]
+
+    def file_url(self, name):
+        """Same result as FileField.to_representation: storage.url() made absolute"""
+        if not name:
+            return None
+        return self._url_prefix + filepath_to_uri(name)
+
+    def format_datetime(self, value):
+        """Same result as DateTimeField.to_representation, minus the per-call timezone lookup"""
+        if not self._iso_datetimes:
+            return serializers.DateTimeField().to_representation(value)
+        if self._timezone is not None:
+            value = value.astimezone(self._timezone)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    def to_representation(self, row):
+        representation = {
+            'id': str(row['id']),
+            'file': self.file_url(row['file']),
+            'original_filename': row['original_filename'],
+            'file_type': row['file_type'],
+            'size': row['size'],
+            'uploaded_at': self.format_datetime(row['uploaded_at']),
+            'hash': row['hash'],
+            'reference_count': row['reference_count'],
+            'is_reference': row['is_reference'],
+        }
+        original_file_id = row['original_file_id']
+        if original_file_id is None:
+            # FileSerializer omits original_file_id entirely when there is no original
+            representation['original_file'] = None
+        else:
+            representation['original_file_id'] = str(original_file_id)
+            representation['original_file'] = {
+                'id': str(original_file_id),
+                'original_filename': row['original_file__original_filename'],
+                'file_type': row['original_file__file_type'],
+                'size': row['original_file__size'],
+                'uploaded_at': row['original_file__uploaded_at'],
+                'hash': row['original_file__hash'],
+                'reference_count': row['original_file__reference_count'],
+            }
+        return representation
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    file_type = serializers.CharField(max_length=100, required=False, default='application/octet-stream')
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'original_filename', 'file_type', 'size', 'received', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'received', 'created_at', 'updated_at']
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Size must be a positive number of bytes")
+        return value
+
+
+class HashCheckSerializer(serializers.Serializer):
+    hash = serializers.RegexField(r'^[0-9a-fA-F]{64}$', error_messages={'invalid': "Expected a hex SHA-256 digest"})
+    size = serializers.IntegerField(min_value=0)
+
+    def validate_hash(self, value):
+        return value.lower()
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=10000, required=False)
+
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestJob
+        fields = ['id', 'status', 'original_filename', 'file_type', 'size', 'bytes_processed', 'progress',
+                  'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        return round(obj.bytes_processed / obj.size, 4) if obj.size else 1.0
@@ -0,0 +1,387 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate_files
+from .chunking import add_manifest, restore_missing_chunks, should_chunk, store_chunks
+from .compression import compress_for_storage
+from .hash_filter import hash_filter
+from .metrics import DEDUP_UPLOADS, REFCOUNT_CONFLICTS
+from .models import File
+from .serializers import FileSerializer
+from .stats import StatsDelta, record_file
+from .storage import blob_locks, content_addressed_name, get_blob_storage, lock_stripe
+
+logger = logging.getLogger(__name__)
+
+# How many times a create that lost a race is retried as a lookup
+CREATE_ATTEMPTS = 3
+# Rows per hash__in lookup, INSERT and CASE UPDATE in batch uploads; keeps
+# every statement well under SQLite's bound-parameter limit
+BATCH_SIZE = 400
+
+
+def increment_reference_count(file_id):
+    """Atomically add one reference to a file and return the new count.
+
+    The increment happens in the database (``UPDATE ... SET reference_count =
+    reference_count + 1``) so concurrent callers can never lose an update.
+    Returns None when the file was deleted in the meantime.
+    """
+    with transaction.atomic():
+        if not File.objects.filter(pk=file_id).update(reference_count=F('reference_count') + 1):
+            return None
+        invalidate_files()
+        row = File.objects.filter(pk=file_id).values_list('reference_count', 'file_type', 'size', 'is_reference').first()
+        if row is None:
+            return None
+        reference_count, file_type, size, is_reference = row
+        if not is_reference:
+            record_file(file_type, size, files=1)
+    return reference_count
+
+
+def release_reference(file_id):
+    """Drop one reference to a file, deleting the row when it was the last one.
+
+    The blob of a deleted row is removed once the transaction commits.
+    Returns ``(deleted, reference_count)``.
+    """
+    with transaction.atomic():
+        instance = File.objects.select_for_update().get(pk=file_id)
+        # The conditional UPDATE keeps this race-free on SQLite, where select_for_update is a no-op
+        decremented = File.objects.filter(pk=file_id, reference_count__gt=1).update(
+            reference_count=F('reference_count') - 1
+        )
+        if decremented:
+            invalidate_files()
+            if not instance.is_reference:
+                record_file(instance.file_type, instance.size, files=-1)
+            reference_count = File.objects.filter(pk=file_id).values_list('reference_count', flat=True).get()
+            logger.info(f"Decremented reference count for file {file_id} to {reference_count}")
+            return False, reference_count
+        instance.delete()
+        if instance.file:
+            name = instance.file.name
+            transaction.on_commit(lambda: remove_blobs([name]))
+        logger.info(f"Deleted file {file_id} as it has no more references")
+        return True, 0
+
+
+def remove_blobs(names):
+    """Delete stored blobs that no File row points at any more; returns how many were removed.
+
+    Names are checked in batched queries under the exclusive blob lock of
+    their stripe, so a blob that was re-uploaded since its row was deleted,
+    or that an upload is about to reference, is kept.
+    """
+    by_stripe = defaultdict(list)
+    for name in {name for name in names if name}:
+        by_stripe[lock_stripe(name)].append(name)
+    storage = get_blob_storage()
+    removed = kept = 0
+    for stripe, stripe_names in sorted(by_stripe.items()):
+        with blob_locks([stripe], exclusive=True):
+            in_use = set()
+            for start in range(0, len(stripe_names), BATCH_SIZE):
+                in_use.update(
+                    File.objects.filter(file__in=stripe_names[start:start + BATCH_SIZE]).values_list('file', flat=True)
+                )
+            kept += len(in_use)
+            for name in stripe_names:
+                if name in in_use:
+                    continue
+                try:
+                    storage.delete(name)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not remove blob {name}: {e}")
+    logger.info(f"Removed {removed} blobs, kept {kept} still in use")
+    return removed
+
+
+def release_references(file_ids):
+    """Drop one reference from each of many files with set-based statements.
+
+    Per batch of ids, one UPDATE decrements every count and one DELETE removes
+    the rows that reached zero, all in a single transaction. Blobs of deleted
+    rows are removed once it commits. Returns ``(deleted, decremented)``.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    deleted = released = 0
+    blob_names = []
+    with transaction.atomic():
+        for start in range(0, len(file_ids), BATCH_SIZE):
+            batch = file_ids[start:start + BATCH_SIZE]
+            # Locked so the recorded totals match what the UPDATE below changes
+            delta = StatsDelta()
+            for file_type, size in File.objects.select_for_update().filter(
+                pk__in=batch, reference_count__gt=0, is_reference=False
+            ).values_list('file_type', 'size'):
+                delta.add(file_type, size, files=-1)
+            delta.save()
+            released += File.objects.filter(pk__in=batch, reference_count__gt=0).update(
+                reference_count=F('reference_count') - 1
+            )
+            unreferenced = File.objects.filter(pk__in=batch, reference_count=0)
+            blob_names.extend(unreferenced.exclude(file='').values_list('file', flat=True))
+            deleted += unreferenced.delete()[1].get(File._meta.label, 0)
+        invalidate_files()
+        if blob_names:
+            transaction.on_commit(lambda: remove_blobs(blob_names))
+    logger.info(f"Released {released} references, deleting {deleted} files")
+    return deleted, released - deleted
+
+
+def reference_existing(file_hash, size=None):
+    """Add a reference to the stored file with this hash, if there is one.
+
+    When ``size`` is given it must match too, as a cheap guard against a wrong
+    client-side hash. Returns the file or None. Hashes the filter has never
+    seen skip the query.
+    """
+    if not hash_filter.might_exist(file_hash):
+        return None
+    existing_file = File.objects.filter(hash=file_hash, is_reference=False).first()
+    hash_filter.confirm(existing_file is not None)
+    if existing_file is None or (size is not None and existing_file.size != size):
+        return None
+    reference_count = increment_reference_count(existing_file.pk)
+    if reference_count is None:
+        # Deleted since the lookup, so the upload has to be stored after all
+        REFCOUNT_CONFLICTS.labels('deleted_since_lookup').inc()
+        logger.info(f"File with hash {file_hash} was deleted before it could be referenced")
+        return None
+    existing_file.reference_count = reference_count
+    DEDUP_UPLOADS.labels('duplicate').inc()
+    logger.info(f"Incremented reference count for file with hash {file_hash} to {existing_file.reference_count}")
+    return existing_file
+
+
+def ingest_upload(file_obj, file_hash, original_filename, file_type, size):
+    """Store an upload whose SHA-256 is already known, deduplicating by hash.
+
+    Returns ``(file, created)``. When a non-reference file with the same hash
+    exists, its reference count is incremented and the upload is discarded
+    without being read again. Two first-time uploads of the same content may
+    race; the loser hits ``unique_hash_for_non_reference`` and is turned into
+    a reference to the winner instead of an error.
+
+    With chunked storage enabled, large new content is stored as a manifest
+    of content-defined chunks instead of one blob; other new content is
+    compressed at rest when the policy for its type says so.
+    """
+    manifest = content = None
+    try:
+        for attempt in range(CREATE_ATTEMPTS):
+            existing_file = reference_existing(file_hash)
+            if existing_file:
+                # Discard the staged upload without reading it again
+                file_obj.close()
+                return existing_file, False
+
+            chunked = should_chunk(size)
+            if chunked and manifest is None:
+                manifest = store_chunks(file_obj)
+            if not chunked and content is None:
+                content, codec = compress_for_storage(file_obj, file_hash, file_type)
+
+            # If no existing file, proceed with normal upload
+            serializer = FileSerializer(data={
+                **({} if chunked else {'file': content}),
+                'original_filename': original_filename,
+                'file_type': file_type,
+                'size': size,
+                'hash': file_hash,
+                'is_reference': False
+            })
+            # Blobs found already stored cannot be deleted under the lock before the row commits
+            locked = [file_hash] + ([digest for _, digest, _ in manifest] if chunked else [])
+            try:
+                with blob_locks(locked), transaction.atomic():
+                    serializer.is_valid(raise_exception=True)
+                    if chunked:
+                        restore_missing_chunks(file_obj, manifest)
+                        instance = serializer.save(is_chunked=True)
+                        add_manifest(instance, manifest)
+                    else:
+                        instance = serializer.save(codec=codec, stored_size=content.size)
+                DEDUP_UPLOADS.labels('new').inc()
+                return instance, True
+            except (IntegrityError, ValidationError) as e:
+                # Either the unique constraint or the serializer's unique validator saw a
+                # concurrent insert; anything else is re-raised once no winner turns up
+                logger.info(f"Create for hash {file_hash} lost a race (attempt {attempt + 1}): {e}")
+                if not File.objects.filter(hash=file_hash, is_reference=False).exists():
+                    raise
+                REFCOUNT_CONFLICTS.labels('create_race').inc()
+                # The winner may be another worker whose hash this process's filter has not seen yet
+                hash_filter.add(file_hash)
+    finally:
+        if content is not None and content is not file_obj:
+            # The compressed copy, unless storage has already moved it into place
+            content.close()
+
+    raise IntegrityError(f"Could not store or reference file with hash {file_hash}")
+
+
+def upload_error(file_obj):
+    """The validation error FileSerializer would raise for this upload's name or type, if any"""
+    for field, value in (('original_filename', file_obj.name), ('file_type', file_obj.content_type)):
+        max_length = File._meta.get_field(field).max_length
+        if not value:
+            return f"{field}: This field may not be blank."
+        if len(value) > max_length:
+            return f"{field}: Ensure this field has no more than {max_length} characters."
+    return None
+
+
+def _add_references(increments):
+    """Add ``increments[pk]`` references to each file in one UPDATE per batch.
+
+    Returns the new reference counts by pk; a file deleted in the meantime is
+    missing from the result.
+    """
+    pks = list(increments)
+    counts = {}
+    for start in range(0, len(pks), BATCH_SIZE):
+        batch = pks[start:start + BATCH_SIZE]
+        File.objects.filter(pk__in=batch).update(reference_count=Case(
+            *[When(pk=pk, then=F('reference_count') + increments[pk]) for pk in batch],
+            default=F('reference_count'),
+            output_field=PositiveIntegerField(),
+        ))
+        counts.update(File.objects.filter(pk__in=batch).values_list('pk', 'reference_count'))
+    return counts
+
+
+def ingest_batch(file_objs, file_hashes, max_workers=None):
+    """Store many uploads whose SHA-256 is known, with a handful of queries in total.
+
+    Equivalent to calling ingest_upload for each file in order: all hashes are
+    resolved with batched ``hash__in`` lookups, blobs for first-time content
+    are written to storage on a thread pool, new rows are inserted with
+    ``bulk_create`` and duplicates get their references in one UPDATE.
+    Repeats of the same content within the batch become references too.
+
+    Returns one ``(file, created, error)`` per upload, in order. When the
+    batch insert loses a race to a concurrent upload of the same content, it
+    falls back to ingest_upload for each file.
+    """
+    results = [None] * len(file_objs)
+    groups = {}  # hash -> indexes of the uploads with that content
+    for index, (file_obj, file_hash) in enumerate(zip(file_objs, file_hashes)):
+        error = upload_error(file_obj)
+        if error:
+            results[index] = (None, False, error)
+        else:
+            groups.setdefault(file_hash, []).append(index)
+
+    hashes = list(groups)
+    # Only hashes the filter may have seen need looking up
+    candidates = [file_hash for file_hash in hashes if hash_filter.might_exist(file_hash)]
+    existing = {}
+    for start in range(0, len(candidates), BATCH_SIZE):
+        for existing_file in File.objects.filter(hash__in=candidates[start:start + BATCH_SIZE], is_reference=False):
+            existing[existing_file.hash] = existing_file
+    hash_filter.confirm(len(existing), len(candidates))
+    new_hashes = [file_hash for file_hash in hashes if file_hash not in existing]
+    # Content stored as chunks goes through ingest_upload one file at a time
+    chunked_hashes = [file_hash for file_hash in new_hashes if should_chunk(file_objs[groups[file_hash][0]].size)]
+    new_hashes = [file_hash for file_hash in new_hashes if not should_chunk(file_objs[groups[file_hash][0]].size)]
+
+    # Write the blobs before the transaction; storing the same bytes again is a no-op
+    storage = get_blob_storage()
+
+    def store(file_hash):
+        """Compress per policy and save; returns ``(name, codec, stored_size)``"""
+        file_obj = file_objs[groups[file_hash][0]]
+        content, codec = compress_for_storage(file_obj, file_hash, file_obj.content_type)
+        try:
+            return storage.save(content_addressed_name(file_hash, codec), content), codec, content.size
+        finally:
+            if content is not file_obj:
+                content.close()
+
+    # Held until the rows commit, so none of these blobs can be deleted by a concurrent release
+    with blob_locks(new_hashes):
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            stored = dict(zip(new_hashes, pool.map(store, new_hashes)))
+
+        new_files = []
+        for file_hash in new_hashes:
+            file_obj = file_objs[groups[file_hash][0]]
+            name, codec, stored_size = stored[file_hash]
+            new_files.append(File(
+                file=name,
+                original_filename=file_obj.name,
+                file_type=file_obj.content_type,
+                size=file_obj.size,
+                hash=file_hash,
+                is_reference=False,
+                codec=codec,
+                stored_size=stored_size,
+                # Repeats within the batch are references to the first copy
+                reference_count=len(groups[file_hash]),
+            ))
+
+        retry = list(chunked_hashes)
+        # bulk_create sends no post_save, so the filter learns the new hashes here
+        hash_filter.add_many(new_hashes)
+        try:
+            with transaction.atomic():
+                File.objects.bulk_create(new_files, batch_size=BATCH_SIZE)
+                invalidate_files()
+                counts = _add_references({existing[file_hash].pk: len(groups[file_hash]) for file_hash in existing})
+                # bulk_create and update() send no signals, so the totals are recorded here
+                delta = StatsDelta()
+                for instance in new_files:
+                    delta.add(
+                        instance.file_type, instance.size, blobs=1, files=instance.reference_count,
+                        stored_size=instance.stored_size,
+                    )
+                for file_hash, existing_file in existing.items():
+                    if existing_file.pk in counts:
+                        delta.add(existing_file.file_type, existing_file.size, files=len(groups[file_hash]))
+                delta.save()
+        except IntegrityError as e:
+            logger.info(f"Batch insert lost a race, ingesting {len(groups)} files one by one: {e}")
+            REFCOUNT_CONFLICTS.labels('batch_race').inc()
+            retry = hashes
+        else:
+            logger.info(f"Batch stored {len(new_files)} new files and referenced {len(existing)} existing ones")
+            for instance in new_files:
+                for position, index in enumerate(groups[instance.hash]):
+                    results[index] = (instance, position == 0, None)
+                DEDUP_UPLOADS.labels('new').inc()
+                DEDUP_UPLOADS.labels('duplicate').inc(len(groups[instance.hash]) - 1)
+            for file_hash, existing_file in existing.items():
+                if existing_file.pk not in counts:
+                    # Deleted since the lookup, so these uploads are stored after all
+                    REFCOUNT_CONFLICTS.labels('deleted_since_lookup').inc()
+                    retry.append(file_hash)
+                    continue
+                existing_file.reference_count = counts[existing_file.pk]
+                DEDUP_UPLOADS.labels('duplicate').inc(len(groups[file_hash]))
+                for index in groups[file_hash]:
+                    results[index] = (existing_file, False, None)
+
+    for file_hash in retry:
+        for index in groups[file_hash]:
+            file_obj = file_objs[index]
+            try:
+                instance, created = ingest_upload(
+                    file_obj, file_hash, file_obj.name, file_obj.content_type, file_obj.size
+                )
+                results[index] = (instance, created, None)
+            except Exception as e:
+                logger.error(f"Error ingesting {file_obj.name} from batch: {str(e)}", exc_info=True)
+                results[index] = (None, False, str(e))
+
+    for file_obj in file_objs:
+        file_obj.close()
+    return results
@@ -0,0 +1,176 @@
+"""Storage totals per file type, maintained incrementally for O(1) reads.
+
+Every path that changes a stored (non-reference) File records its delta
+here inside the same transaction: save() and delete() through signals,
+set-based reference count updates in services.py explicitly. ``manage.py
+reconcile_stats`` rebuilds the table from the files themselves.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import File, FileTypeStats
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('unique_blobs', 'total_files', 'stored_bytes', 'logical_bytes')
+
+
+class StatsDelta:
+    """Accumulates changes per file type so they are written with one UPDATE each"""
+
+    def __init__(self):
+        self.totals = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+
+    def add(self, file_type, size, blobs=0, files=0, stored_size=None):
+        """``blobs`` stored copies and ``files`` references of a blob of ``size`` bytes.
+
+        ``stored_size`` is the blob's size on disk when it is stored compressed.
+        """
+        totals = self.totals[file_type]
+        totals['unique_blobs'] += blobs
+        totals['total_files'] += files
+        totals['stored_bytes'] += blobs * (size if stored_size is None else stored_size)
+        totals['logical_bytes'] += files * size
+
+    def save(self):
+        for file_type, totals in self.totals.items():
+            if any(totals.values()):
+                record_change(file_type, **totals)
+        self.totals.clear()
+
+
+def record_change(file_type, **deltas):
+    """Add ``deltas`` to the totals for ``file_type``, creating its row on first use"""
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if FileTypeStats.objects.filter(file_type=file_type).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            FileTypeStats.objects.create(file_type=file_type, **deltas)
+    except IntegrityError:
+        # A concurrent writer created the row first
+        FileTypeStats.objects.filter(file_type=file_type).update(**updates)
+
+
+def record_file(file_type, size, blobs=0, files=0, stored_size=None):
+    delta = StatsDelta()
+    delta.add(file_type, size, blobs, files, stored_size)
+    delta.save()
+
+
+def compute_stats():
+    """Totals per file type aggregated from the files themselves (a full scan)"""
+    rows = (
+        File.objects.filter(is_reference=False)
+        .values('file_type')
+        .annotate(
+            unique_blobs=Count('id'),
+            total_files=Sum('reference_count'),
+            stored_bytes=Sum(Coalesce('stored_size', 'size')),
+            logical_bytes=Sum(F('size') * F('reference_count')),
+        )
+        .order_by()
+    )
+    return {row.pop('file_type'): {field: row[field] or 0 for field in FIELDS} for row in rows}
+
+
+def current_stats():
+    """Totals per file type as currently recorded in the summary table"""
+    return {
+        row.pop('file_type'): row
+        for row in FileTypeStats.objects.values('file_type', *FIELDS)
+    }
+
+
+def stats_drift(recorded, actual):
+    """``{file_type: {field: recorded - actual}}`` for the types and fields that differ"""
+    drift = {}
+    zero = dict.fromkeys(FIELDS, 0)
+    for file_type in recorded.keys() | actual.keys():
+        before, after = recorded.get(file_type, zero), actual.get(file_type, zero)
+        differences = {field: before[field] - after[field] for field in FIELDS if before[field] != after[field]}
+        if differences:
+            drift[file_type] = differences
+    return drift
+
+
+def rebuild_stats():
+    """Replace the summary table with freshly computed totals and return the drift corrected"""
+    with transaction.atomic():
+        # Lock the rows so incremental updates wait for the rebuild
+        recorded = {
+            row.pop('file_type'): row
+            for row in FileTypeStats.objects.select_for_update().values('file_type', *FIELDS)
+        }
+        actual = compute_stats()
+        drift = stats_drift(recorded, actual)
+        FileTypeStats.objects.all().delete()
+        FileTypeStats.objects.bulk_create(
+            FileTypeStats(file_type=file_type, **totals) for file_type, totals in actual.items()
+        )
+    if drift:
+        logger.warning(f"Corrected file stats drift for {len(drift)} file types: {drift}")
+    return drift
+
+
+def summarize(by_type):
+    """Overall totals and dedup savings from per-type totals, as the stats endpoint returns them"""
+    totals = dict.fromkeys(FIELDS, 0)
+    breakdown = []
+    for file_type, row in sorted(by_type.items()):
+        if not row['unique_blobs']:
+            continue
+        for field in FIELDS:
+            totals[field] += row[field]
+        breakdown.append({
+            'file_type': file_type,
+            **{field: row[field] for field in FIELDS},
+            'saved_bytes': row['logical_bytes'] - row['stored_bytes'],
+        })
+    return {
+        **totals,
+        'saved_bytes': totals['logical_bytes'] - totals['stored_bytes'],
+        'by_file_type': breakdown,
+    }
+
+
+def file_will_save(sender, instance, raw=False, **kwargs):
+    """Remember a row's stored values before an update so post_save can apply the difference"""
+    if raw or instance._state.adding:
+        return
+    instance._stats_before = (
+        File.objects.filter(pk=instance.pk)
+        .values_list('file_type', 'size', 'reference_count', 'is_reference', 'stored_size')
+        .first()
+    )
+
+
+def file_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    delta = StatsDelta()
+    before = getattr(instance, '_stats_before', None)
+    instance._stats_before = None
+    if not created and before is not None:
+        file_type, size, reference_count, is_reference, stored_size = before
+        if not is_reference:
+            delta.add(file_type, size, blobs=-1, files=-reference_count, stored_size=stored_size)
+    if not instance.is_reference:
+        delta.add(
+            instance.file_type, instance.size, blobs=1, files=instance.reference_count,
+            stored_size=instance.stored_size,
+        )
+    delta.save()
+
+
+def file_deleted(sender, instance, **kwargs):
+    if not instance.is_reference:
+        # Rows released in bulk are deleted at a count of zero; their references were already subtracted
+        record_file(
+            instance.file_type, instance.size, blobs=-1, files=-instance.reference_count,
+            stored_size=instance.stored_size,
+        )
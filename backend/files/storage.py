@@ -0,0 +1,167 @@
+import os
+import tempfile
+import time
+import logging
+from contextlib import ExitStack, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: stores and deletes of the same blob are not serialized
+    fcntl = None
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+from .hashing import get_setting, new_hasher
+from .metrics import STORAGE_WRITE_SECONDS, phase, record_hashing
+
+logger = logging.getLogger(__name__)
+
+CAS_PREFIX = 'cas'
+# Pieces of files stored with content-defined chunking (see files.chunking)
+CHUNK_PREFIX = 'chunks'
+# Compressed blobs carry their codec in the name, so raw and compressed copies never collide
+CODEC_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+# Lock files serializing blob deletes against stores of the same content, under MEDIA_ROOT
+LOCK_DIRNAME = '.locks'
+
+
+def content_addressed_name(digest, codec=''):
+    """Return the sharded storage name for a SHA-256 digest, e.g. cas/ab/cd/<digest>[.gz]"""
+    return '/'.join([CAS_PREFIX, digest[:2], digest[2:4], digest + CODEC_SUFFIXES.get(codec, '')])
+
+
+def chunk_name(digest):
+    """Return the sharded storage name for a chunk's SHA-256, e.g. chunks/ab/cd/<digest>"""
+    return '/'.join([CHUNK_PREFIX, digest[:2], digest[2:4], digest])
+
+
+def get_blob_storage():
+    """Return the storage used for uploaded file blobs"""
+    return storages['blobs']
+
+
+def lock_stripe(name):
+    """The lock a blob or chunk is covered by: the first two hex digits of its digest"""
+    return os.path.basename(name)[:2]
+
+
+@contextmanager
+def blob_locks(names, exclusive=False):
+    """Hold the locks covering these digests or blob names, shared unless ``exclusive``.
+
+    Uploads write their blobs and commit the rows pointing at them under a
+    shared lock; deletes re-check the database and unlink under an exclusive
+    one. So a delete never removes a blob that an upload found already stored
+    and is about to reference. Locks are striped over 256 files (one per
+    digest prefix) and held with flock, across threads and processes.
+    """
+    stripes = sorted({lock_stripe(name) for name in names if name})
+    if fcntl is None or not stripes:
+        yield
+        return
+    lock_dir = get_blob_storage().path(LOCK_DIRNAME)
+    os.makedirs(lock_dir, exist_ok=True)
+    with ExitStack() as stack:
+        # Always taken in sorted order, so two holders of several locks cannot deadlock
+        for stripe in stripes:
+            fd = os.open(os.path.join(lock_dir, f"{stripe}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            stack.callback(os.close, fd)
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Filesystem storage that names every blob after the SHA-256 of its content.
+
+    Blobs live at ``cas/ab/cd/<sha256>``, so identical content always maps to
+    the same path and a directory never holds more than a few thousand
+    entries. The name requested by the caller is ignored: the digest attached
+    by the upload handlers (``content.sha256``) is used when present, otherwise
+    the content is hashed while it is written to a staging file. Content
+    with a ``codec`` (see files.compression) is stored under a suffixed name.
+    """
+
+    staging_dirname = '.staging'
+
+    def get_available_name(self, name, max_length=None):
+        # A name collision means the same bytes are already stored
+        return name
+
+    def _save(self, name, content):
+        with phase('storage', STORAGE_WRITE_SECONDS.labels('blob')):
+            return self._store(content)
+
+    def _store(self, content):
+        digest = getattr(content, 'sha256', None)
+        staged_path = None
+        if hasattr(content, 'temporary_file_path') and digest:
+            source_path = content.temporary_file_path()
+        else:
+            staged_path, digest = self._stage(content, digest)
+            source_path = staged_path
+
+        name = content_addressed_name(digest, getattr(content, 'codec', ''))
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            logger.info(f"Blob {name} already stored, discarding staged copy")
+            if staged_path:
+                os.remove(staged_path)
+            return name
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if staged_path:
+            os.replace(staged_path, full_path)
+        else:
+            # Overwriting is safe: a concurrent writer can only have produced the same bytes
+            file_move_safe(source_path, full_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def save_chunk(self, digest, data):
+        """Store one chunk under chunks/ab/cd/<digest>; a no-op when it is already there"""
+        name = chunk_name(digest)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        with phase('storage', STORAGE_WRITE_SECONDS.labels('chunk')):
+            staging_dir = self.path(self.staging_dirname)
+            os.makedirs(staging_dir, exist_ok=True)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            fd, staged_path = tempfile.mkstemp(dir=staging_dir, suffix='.chunk')
+            try:
+                with os.fdopen(fd, 'wb') as staged:
+                    staged.write(data)
+                os.replace(staged_path, full_path)
+            except Exception:
+                if os.path.exists(staged_path):
+                    os.remove(staged_path)
+                raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def _stage(self, content, digest=None):
+        """Stream content into a staging file, hashing it unless the digest is already known"""
+        staging_dir = self.path(self.staging_dirname)
+        os.makedirs(staging_dir, exist_ok=True)
+        sha256 = None if digest else new_hasher()
+        fd, staged_path = tempfile.mkstemp(dir=staging_dir, suffix='.upload')
+        size, hash_seconds = 0, 0.0
+        try:
+            with os.fdopen(fd, 'wb') as staged:
+                for chunk in content.chunks(get_setting('CHUNK_SIZE')):
+                    staged.write(chunk)
+                    if sha256 is not None:
+                        start = time.perf_counter()
+                        sha256.update(chunk)
+                        hash_seconds += time.perf_counter() - start
+                        size += len(chunk)
+        except Exception:
+            os.remove(staged_path)
+            raise
+        if sha256 is None:
+            return staged_path, digest
+        record_hashing('storage', size, hash_seconds)
+        return staged_path, sha256.hexdigest()
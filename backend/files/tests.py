@@ -0,0 +1,575 @@
+import fcntl
+import gzip
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from .cache import bump_generation
+from .compression import policy_for
+from . import upload_sessions
+from .downloads import open_blob
+from .ingest_jobs import claim_job, enqueue, process_job, requeue_stale
+from .models import File, IngestJob, UploadSession
+from .services import increment_reference_count, ingest_upload, release_reference, remove_blobs
+from .storage import blob_locks, get_blob_storage
+from .upload_sessions import ChunkOffsetError, append_chunk
+
+
+class IsolatedMediaMixin:
+    """Store blobs and cached responses in a temporary directory per test class"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp(prefix='filehub-test-')
+        caches = {**settings.CACHES, settings.FILES_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': f"{cls.workdir}/cache",
+        }}
+        cls.isolated_settings = override_settings(
+            MEDIA_ROOT=f"{cls.workdir}/media", FILE_UPLOAD_TEMP_DIR=f"{cls.workdir}/media/.staging", CACHES=caches,
+        )
+        cls.isolated_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.isolated_settings.disable()
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+
+    def upload(self, name, content, content_type='text/plain'):
+        # Run on_commit work (cache invalidation, blob cleanup) as a real request would
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/files/', {'file': SimpleUploadedFile(name, content, content_type)})
+        self.assertIn(response.status_code, (status.HTTP_200_OK, status.HTTP_201_CREATED))
+        return response
+
+
+class BulkDeleteTests(IsolatedMediaMixin, APITestCase):
+    def setUp(self):
+        self.upload('notes.txt', b'notes')
+        self.upload('report.txt', b'report')
+        self.upload('photo.png', b'\x89PNG photo', 'image/png')
+
+    def bulk_delete(self, query=''):
+        return self.client.post(f'/api/files/bulk-delete/{query}')
+
+    def test_requires_ids_or_filter(self):
+        response = self.bulk_delete()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(File.objects.count(), 3)
+
+    def test_empty_filter_values_delete_nothing(self):
+        for query in ('?search=', '?search=%20', '?file_type=', '?min_size=', '?is_reference=', '?file_type=&search='):
+            with self.subTest(query=query):
+                response = self.bulk_delete(query)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(File.objects.count(), 3)
+
+    def test_invalid_filter_value_is_rejected(self):
+        response = self.bulk_delete('?min_size=big')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(File.objects.count(), 3)
+
+    def test_filter_matching_every_file_is_refused(self):
+        response = self.bulk_delete('?min_size=0')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(File.objects.count(), 3)
+
+    def test_filter_deletes_matching_files(self):
+        response = self.bulk_delete('?file_type=text/plain')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'deleted': 2, 'decremented': 0})
+        self.assertEqual(list(File.objects.values_list('file_type', flat=True)), ['image/png'])
+
+
+class IngestJobTests(IsolatedMediaMixin, APITestCase):
+    def setUp(self):
+        enqueue(SimpleUploadedFile('queued.txt', b'queued content', 'text/plain'))
+        self.job = claim_job('worker-1')
+
+    def test_process_job_stores_the_upload(self):
+        self.assertTrue(process_job(self.job))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, IngestJob.DONE)
+        self.assertEqual(self.job.file.original_filename, 'queued.txt')
+
+    def test_requeue_goes_by_heartbeat_not_start_time(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        IngestJob.objects.filter(pk=self.job.pk).update(started_at=long_ago)
+        self.assertEqual(requeue_stale(600), 0)
+
+        IngestJob.objects.filter(pk=self.job.pk).update(heartbeat_at=long_ago)
+        self.assertEqual(requeue_stale(600), 1)
+        self.assertEqual(IngestJob.objects.get(pk=self.job.pk).status, IngestJob.QUEUED)
+
+    def test_requeued_job_is_left_to_its_new_worker(self):
+        IngestJob.objects.filter(pk=self.job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        requeue_stale(600)
+        claim_job('worker-2')
+
+        self.assertFalse(process_job(self.job))
+        job = IngestJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.worker), (IngestJob.RUNNING, 'worker-2'))
+        self.assertTrue(os.path.exists(job.staging_path))
+        self.assertFalse(File.objects.exists())
+
+
+class ReferenceQueryCountTests(IsolatedMediaMixin, APITestCase):
+    """Reference parents are joined in, so query counts do not grow with the page size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.original = File.objects.create(
+            file='cas/00/00/original', original_filename='original.txt', file_type='text/plain', size=8,
+            hash='0' * 64, reference_count=56,
+        )
+        File.objects.bulk_create(
+            File(
+                original_filename=f"copy-{index}.txt", file_type='text/plain', size=8, hash='',
+                is_reference=True, original_file=cls.original,
+            )
+            for index in range(55)
+        )
+
+    def get_uncached(self, url):
+        # A new generation guarantees the response is built rather than served from the cache
+        bump_generation()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_list_page_of_references(self):
+        for page_size in (5, 55):
+            with self.subTest(page_size=page_size), self.assertNumQueries(1):
+                body = self.get_uncached(f'/api/files/?is_reference=true&page_size={page_size}')
+            self.assertEqual(len(body['results']), page_size)
+
+    def test_retrieve_reference(self):
+        reference = File.objects.filter(is_reference=True).first()
+        with self.assertNumQueries(1):
+            body = self.get_uncached(f'/api/files/{reference.pk}/')
+        self.assertEqual(body['original_filename'], reference.original_filename)
+
+
+class ReferenceCountConcurrencyTests(IsolatedMediaMixin, TransactionTestCase):
+    """Many threads uploading, then deleting, the same content must neither lose counts nor duplicate rows"""
+    threads = 8
+    iterations = 10
+
+    def run_threads(self, target):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(self.iterations):
+                    target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_uploads_and_deletes(self):
+        content = b'shared content ' * 1000
+        file_hash = hashlib.sha256(content).hexdigest()
+        created = []
+
+        def upload():
+            upload = SimpleUploadedFile('shared.bin', content, 'application/octet-stream')
+            instance, was_created = ingest_upload(upload, file_hash, upload.name, upload.content_type, len(content))
+            if was_created:
+                created.append(instance.pk)
+
+        self.run_threads(upload)
+        stored = File.objects.get(hash=file_hash, is_reference=False)
+        self.assertEqual(created, [stored.pk])
+        self.assertEqual(stored.reference_count, self.threads * self.iterations)
+
+        deleted = []
+
+        def delete():
+            was_deleted, _ = release_reference(stored.pk)
+            if was_deleted:
+                deleted.append(stored.pk)
+
+        self.run_threads(delete)
+        self.assertEqual(deleted, [stored.pk])
+        self.assertFalse(File.objects.filter(hash=file_hash).exists())
+
+    def test_file_deleted_between_lookup_and_increment(self):
+        content = b'deleted meanwhile ' * 100
+        file_hash = hashlib.sha256(content).hexdigest()
+        stored, _ = ingest_upload(SimpleUploadedFile('first.bin', content), file_hash, 'first.bin', 'text/plain', len(content))
+
+        def delete_then_increment(file_id):
+            # Another request releases the last reference right after this upload's lookup found the file
+            release_reference(file_id)
+            return increment_reference_count(file_id)
+
+        with mock.patch('files.services.increment_reference_count', side_effect=delete_then_increment):
+            instance, created = ingest_upload(
+                SimpleUploadedFile('second.bin', content), file_hash, 'second.bin', 'text/plain', len(content)
+            )
+
+        self.assertTrue(created)
+        self.assertNotEqual(instance.pk, stored.pk)
+        self.assertEqual(File.objects.get(hash=file_hash, is_reference=False).pk, instance.pk)
+        blob = open_blob(instance)
+        try:
+            self.assertEqual(blob.read(), content)
+        finally:
+            blob.close()
+
+
+class BlobLockTests(IsolatedMediaMixin, TransactionTestCase):
+    def test_blob_delete_waits_for_an_upload_reusing_it(self):
+        content = b'reused blob'
+        stored, _ = ingest_upload(SimpleUploadedFile('old.bin', content), hashlib.sha256(content).hexdigest(),
+                                  'old.bin', 'application/octet-stream', len(content))
+        name = stored.file.name
+        # The row is gone but its blob's removal has not run yet
+        File.objects.filter(pk=stored.pk).delete()
+        removed = []
+
+        def remove():
+            try:
+                removed.append(remove_blobs([name]))
+            finally:
+                connection.close()
+
+        with blob_locks([stored.hash]):
+            # An upload of the same content finds the blob in place and commits a row for it
+            thread = threading.Thread(target=remove)
+            thread.start()
+            thread.join(timeout=0.2)
+            self.assertTrue(thread.is_alive())
+            File.objects.create(
+                file=name, original_filename='new.bin', file_type='application/octet-stream',
+                size=len(content), hash=stored.hash,
+            )
+        thread.join()
+
+        self.assertEqual(removed, [0])
+        self.assertTrue(get_blob_storage().exists(name))
+
+        File.objects.filter(file=name).delete()
+        self.assertEqual(remove_blobs([name]), 1)
+        self.assertFalse(get_blob_storage().exists(name))
+
+
+class OrderingTests(IsolatedMediaMixin, APITestCase):
+    def test_multiple_ordering_fields_are_rejected(self):
+        for url in ('/api/files/', '/api/async/files/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'ordering': 'size,-reference_count'})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('ordering', response.json())
+
+    def test_single_field_pages_through_ties(self):
+        for index in range(5):
+            self.upload(f'{index}.txt', f'same size {index}'.encode())
+        seen, url = [], '/api/files/?ordering=-size&page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+
+@override_settings(FILES_COMPRESSION={'CODEC': ''}, FILES_SENDFILE_BACKEND=None)
+class DownloadTests(IsolatedMediaMixin, APITestCase):
+    content = bytes(range(256)) * 8
+
+    def setUp(self):
+        file_id = self.upload('data.bin', self.content, 'application/octet-stream').json()['id']
+        self.url = f'/api/files/{file_id}/download/'
+        self.etag = f'"{hashlib.sha256(self.content).hexdigest()}"'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = response.getvalue() if response.status_code in (200, 206) else b''
+        return response, body
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_single_range(self):
+        response, body = self.get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_suffix_range(self):
+        response, body = self.get(Range='bytes=-5')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body, self.content[-5:])
+        size = len(self.content)
+        self.assertEqual(response['Content-Range'], f'bytes {size - 5}-{size - 1}/{size}')
+
+    def test_range_end_past_eof_is_clamped(self):
+        size = len(self.content)
+        response, body = self.get(Range=f'bytes={size - 3}-{size + 100}')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body, self.content[-3:])
+        self.assertEqual(response['Content-Range'], f'bytes {size - 3}-{size - 1}/{size}')
+        self.assertEqual(response['Content-Length'], '3')
+
+    def test_unsatisfiable_range(self):
+        size = len(self.content)
+        for header in (f'bytes={size}-', 'bytes=-0', 'bytes=20-10'):
+            with self.subTest(range=header):
+                response, _ = self.get(Range=header)
+                self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_multiple_ranges_get_the_whole_file(self):
+        response, body = self.get(Range='bytes=0-1,4-5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, self.content)
+
+    def test_if_range(self):
+        response, body = self.get(Range='bytes=0-3', **{'If-Range': self.etag})
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body, self.content[:4])
+
+        # A stale validator means the client's partial copy is out of date
+        response, body = self.get(Range='bytes=0-3', **{'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, self.content)
+
+    def test_if_none_match(self):
+        response, _ = self.get(**{'If-None-Match': self.etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], self.etag)
+        response, _ = self.get(**{'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(FILES_COMPRESSION={'CODEC': 'gzip'})
+    def test_compressed_blob(self):
+        content = b'compressible line\n' * 500
+        file_id = self.upload('log.txt', content).json()['id']
+        self.assertEqual(File.objects.get(pk=file_id).codec, 'gzip')
+        url = f'/api/files/{file_id}/download/'
+        digest = hashlib.sha256(content).hexdigest()
+
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{digest}-gzip"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.getvalue()), content)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        self.assertEqual(response.getvalue(), content)
+
+        # Ranges address the decoded bytes, even when the client accepts gzip
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=18-35'})
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Range'], f'bytes 18-35/{len(content)}')
+        self.assertEqual(response.getvalue(), content[18:36])
+
+
+class GcBlobsTests(IsolatedMediaMixin, APITestCase):
+    def test_prunes_rows_across_batches(self):
+        kept = self.upload('kept.txt', b'still on disk').json()['id']
+        for index in range(5):
+            digest = hashlib.sha256(str(index).encode()).hexdigest()
+            File.objects.create(
+                file=f'cas/{digest[:2]}/{digest[2:4]}/{digest}', original_filename=f'{index}.txt',
+                file_type='text/plain', size=1, hash=digest,
+            )
+
+        call_command('gc_blobs', prune_rows=True, batch_size=2, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(list(File.objects.values_list('id', flat=True)), [uuid.UUID(kept)])
+
+
+class MigrateToCasTests(IsolatedMediaMixin, APITestCase):
+    def test_cached_responses_are_dropped_once_blobs_moved(self):
+        file_id = self.upload('legacy.txt', b'legacy layout').json()['id']
+        storage = get_blob_storage()
+        stored = File.objects.get(pk=file_id)
+        legacy_name = 'uploads/legacy.txt'
+        os.makedirs(storage.path('uploads'), exist_ok=True)
+        os.replace(storage.path(stored.file.name), storage.path(legacy_name))
+        File.objects.filter(pk=file_id).update(file=legacy_name)
+        bump_generation()
+        etag = self.client.get('/api/files/')['ETag']
+
+        # Per-row invalidation can race a reader; the final bump must cover it on its own
+        with mock.patch('files.management.commands.migrate_to_cas.invalidate_files'):
+            call_command('migrate_to_cas', stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(File.objects.get(pk=file_id).file.name, stored.file.name)
+        response = self.client.get('/api/files/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CompressionPolicyTests(SimpleTestCase):
+    def test_off_by_default(self):
+        self.assertEqual(policy_for('text/plain')[0], '')
+
+    @override_settings(FILES_COMPRESSION={'CODEC': '', 'TYPES': {'text/*': {'codec': 'gzip'}}})
+    def test_enabled_for_listed_types_only(self):
+        self.assertEqual(policy_for('text/csv')[0], 'gzip')
+        self.assertEqual(policy_for('application/octet-stream')[0], '')
+
+
+class UploadSessionTests(IsolatedMediaMixin, TransactionTestCase):
+    def start_session(self, content):
+        response = self.client.post('/api/uploads/', {'original_filename': 'big.bin', 'size': len(content)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return UploadSession.objects.get(pk=response.json()['id'])
+
+    def test_chunk_waits_for_a_worker_holding_the_staged_file(self):
+        session = self.start_session(b'abcdef')
+        results = []
+
+        def append():
+            try:
+                results.append(append_chunk(UploadSession.objects.get(pk=session.pk), 0, io.BytesIO(b'abc')))
+            except ChunkOffsetError as e:
+                results.append(e)
+            finally:
+                connection.close()
+
+        os.makedirs(os.path.dirname(session.staging_path), exist_ok=True)
+        # Stands in for another process writing the same session
+        with open(session.staging_path, 'wb') as other:
+            fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+            thread = threading.Thread(target=append)
+            thread.start()
+            thread.join(timeout=0.2)
+            self.assertTrue(thread.is_alive())
+            other.write(b'abc')
+            UploadSession.objects.filter(pk=session.pk).update(received=3)
+        thread.join()
+
+        # The waiting chunk sees the offset moved and does not overwrite the other worker's bytes
+        self.assertIsInstance(results[0], ChunkOffsetError)
+        self.assertEqual(results[0].expected, 3)
+        session.refresh_from_db()
+        self.assertEqual(session.received, 3)
+
+    def test_idle_hash_states_are_dropped(self):
+        stale = UploadSession(pk=uuid.uuid4())
+        upload_sessions._hash_states[stale.pk] = (0, None, time.monotonic() - upload_sessions.HASH_STATE_IDLE_SECONDS - 1)
+        session = self.start_session(b'abcdef')
+        append_chunk(session, 0, io.BytesIO(b'abc'))
+        self.assertNotIn(stale.pk, upload_sessions._hash_states)
+        self.assertIn(session.pk, upload_sessions._hash_states)
+
+    def test_failed_finalize_can_be_retried(self):
+        content = b'abcdef'
+        session = self.start_session(content)
+        self.client.put(f'/api/uploads/{session.pk}/chunk/?offset=0', content, content_type='application/octet-stream')
+
+        open_files = len(os.listdir('/proc/self/fd'))
+        with mock.patch('files.views.ingest_upload', side_effect=OSError("disk full")):
+            response = self.client.post(f'/api/uploads/{session.pk}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), open_files)
+        self.assertTrue(os.path.exists(session.staging_path))
+
+        response = self.client.post(f'/api/uploads/{session.pk}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['hash'], hashlib.sha256(content).hexdigest())
+        self.assertFalse(os.path.exists(session.staging_path))
+
+
+class ResponseCacheTests(IsolatedMediaMixin, APITestCase):
+    def test_revalidation_goes_by_etag_only(self):
+        self.upload('first.txt', b'first')
+        response = self.client.get('/api/files/')
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/files/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A change within the same second must not be hidden behind If-Modified-Since
+        self.upload('second.txt', b'second')
+        response = self.client.get('/api/files/', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 2)
+        response = self.client.get('/api/files/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class AsyncViewTests(IsolatedMediaMixin, APITestCase):
+    def setUp(self):
+        self.file_id = self.upload('async.txt', b'served asynchronously').json()['id']
+        self.async_client = AsyncClient()
+
+    async def test_list_and_detail_revalidate_by_etag(self):
+        for url in ('/api/async/files/', f'/api/async/files/{self.file_id}/'):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                etag = response['ETag']
+                response = await self.async_client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(response['ETag'], etag)
+
+    async def test_missing_file_is_not_cached(self):
+        url = '/api/async/files/00000000-0000-0000-0000-000000000000/'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+    async def test_duplicate_upload_is_one_reference(self):
+        upload = SimpleUploadedFile('again.txt', b'served asynchronously', 'text/plain')
+        response = await self.async_client.post('/api/async/files/', {'file': upload})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['file']['reference_count'], 2)
+
+    async def test_download_range(self):
+        url = f'/api/async/files/{self.file_id}/download/'
+        response = await self.async_client.get(url, headers={'Range': 'bytes=7-20'})
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], 'bytes 7-20/21')
+        self.assertEqual(b''.join([part async for part in response]), b'asynchronously')
+
+    async def test_no_middleware_runs_async_views_on_a_thread(self):
+        # Django only logs middleware adaptation with DEBUG on, when the handler is built
+        with self.settings(DEBUG=True), self.assertLogs('django.request', 'DEBUG') as logs:
+            logging.getLogger('django.request').debug("handler built")
+            await self.async_client.get('/api/async/files/')
+        self.assertEqual([line for line in logs.output if 'adapted for middleware' in line], [])
+
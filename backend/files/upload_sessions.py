@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunk writes are serialized within a process only
+    fcntl = None
+
+from django.core.files import File as DjangoFile
+
+from .hashing import hash_stream, new_hasher
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+CHUNK_READ_SIZE = 1024 * 1024
+
+# Running SHA-256 state per session, keyed by session id: (bytes hashed, hasher, last used).
+# hashlib objects cannot be persisted, so a worker that has not seen the earlier
+# chunks (or was restarted) rebuilds the state once from the staged prefix.
+_hash_states = {}
+_hash_states_lock = threading.Lock()
+# States of sessions that stopped receiving chunks are dropped after this long
+HASH_STATE_IDLE_SECONDS = 3600
+# Only used without fcntl, where the staged file cannot be locked
+_staging_lock = threading.Lock()
+
+
+class ChunkOffsetError(Exception):
+    """Raised when a chunk does not start at the session's current offset"""
+
+    def __init__(self, expected):
+        super().__init__(f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+
+class StagedFile(DjangoFile):
+    """An assembled upload on the staging volume, ready to be renamed into storage"""
+
+    def __init__(self, path, name, content_type, sha256):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+        self.content_type = content_type
+        self.sha256 = sha256
+        self.size = os.path.getsize(path)
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        super().close()
+        try:
+            # Gone already if storage renamed it into place
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the staged bytes so the upload can be finalized again
+            self.file.close()
+
+
+@contextmanager
+def _locked_staging(session):
+    """Open the staged bytes of ``session`` for update, locked against every other worker"""
+    os.makedirs(os.path.dirname(session.staging_path), exist_ok=True)
+    fd = os.open(session.staging_path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+b') as staged:
+        if fcntl is None:
+            with _staging_lock:
+                yield staged
+        else:
+            # Released when the file is closed
+            fcntl.flock(staged.fileno(), fcntl.LOCK_EX)
+            yield staged
+
+
+def _save_state(session, received, sha256):
+    now = time.monotonic()
+    with _hash_states_lock:
+        _hash_states[session.id] = (received, sha256, now)
+        idle = [key for key, state in _hash_states.items() if now - state[2] > HASH_STATE_IDLE_SECONDS]
+        for key in idle:
+            del _hash_states[key]
+    if idle:
+        logger.info(f"Dropped hash state of {len(idle)} idle upload sessions")
+
+
+def _hasher_at(session, offset):
+    """Return a SHA-256 object covering exactly the first ``offset`` staged bytes"""
+    state = _hash_states.get(session.id)
+    if state and state[0] == offset:
+        # Work on a copy so a chunk that fails halfway cannot corrupt the saved state
+        return state[1].copy()
+
+    logger.info(f"Rebuilding hash state for upload session {session.id} from {offset} staged bytes")
+    sha256 = new_hasher()
+    if offset:
+        with open(session.staging_path, 'rb', buffering=0) as staged:
+            hash_stream(staged, sha256, limit=offset)
+    return sha256
+
+
+def append_chunk(session, offset, stream):
+    """Append the bytes of ``stream`` at ``offset``, hashing them as they are written.
+
+    Returns the new number of received bytes.
+    """
+    with _locked_staging(session) as staged:
+        # Checked under the file lock, so no other worker can move the offset until we are done
+        session.refresh_from_db(fields=['received'])
+        if offset != session.received:
+            raise ChunkOffsetError(session.received)
+
+        sha256 = _hasher_at(session, offset)
+        written = 0
+        staged.seek(offset)
+        while True:
+            data = stream.read(CHUNK_READ_SIZE)
+            if not data:
+                break
+            if offset + written + len(data) > session.size:
+                raise ValueError("Chunk extends past the declared upload size")
+            staged.write(data)
+            sha256.update(data)
+            written += len(data)
+        # Drop any bytes left over from an earlier, interrupted attempt at this offset
+        staged.truncate()
+        staged.flush()
+
+        received = offset + written
+        updated = UploadSession.objects.filter(pk=session.pk, received=offset).update(received=received)
+        if not updated:
+            discard_state(session)
+            session.refresh_from_db(fields=['received'])
+            raise ChunkOffsetError(session.received)
+        _save_state(session, received, sha256)
+        session.received = received
+        return received
+
+
+def assemble(session):
+    """Return the completed upload as a StagedFile carrying its SHA-256"""
+    with _locked_staging(session) as staged:
+        if os.fstat(staged.fileno()).st_size != session.received:
+            raise ValueError(f"Staged upload does not hold the {session.received} bytes received")
+        sha256 = _hasher_at(session, session.received)
+        assembled = StagedFile(session.staging_path, session.original_filename, session.file_type, sha256.hexdigest())
+    discard_state(session)
+    return assembled
+
+
+def discard_state(session, remove_staged=False):
+    """Forget the in-process hash state of a session, optionally removing its staged bytes"""
+    with _hash_states_lock:
+        _hash_states.pop(session.id, None)
+    if remove_staged:
+        try:
+            os.remove(session.staging_path)
+        except FileNotFoundError:
+            pass
@@ -1,10 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FileViewSet
+from . import async_views
+from .views import FileViewSet, IngestJobViewSet, StatsViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'files', FileViewSet)
+router.register(r'uploads', UploadSessionViewSet)
+router.register(r'ingest', IngestJobViewSet)
+router.register(r'stats', StatsViewSet, basename='stats')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/files/', async_views.file_collection, name='async-file-list'),
+    path('async/files/<uuid:pk>/', async_views.file_detail, name='async-file-detail'),
+    path('async/files/<uuid:pk>/download/', async_views.file_download, name='async-file-download'),
 ] 
\ No newline at end of file
@@ -1,8 +1,26 @@
 # utils.py
-import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .hashing import hash_file
 
 def compute_file_hash(file_obj):
-    sha256 = hashlib.sha256()
-    for chunk in file_obj.chunks():
-        sha256.update(chunk)
-    return sha256.hexdigest()
+    return hash_file(file_obj)
+
+def get_upload_hash(file_obj):
+    """Return the SHA-256 computed while the upload was received, hashing it only as a fallback"""
+    precomputed = getattr(file_obj, 'sha256', None)
+    if precomputed:
+        return precomputed
+    return compute_file_hash(file_obj)
+
+def get_upload_hashes(file_objs, max_workers=None):
+    """Return the SHA-256 of every upload, hashing the ones the upload handlers missed on a thread pool.
+
+    hashlib releases the GIL while it digests a chunk, so the threads run in parallel.
+    """
+    missing = [file_obj for file_obj in file_objs if not getattr(file_obj, 'sha256', None)]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for file_obj, digest in zip(missing, pool.map(compute_file_hash, missing)):
+                file_obj.sha256 = digest
+    return [file_obj.sha256 for file_obj in file_objs]
@@ -1,13 +1,28 @@
 from django.shortcuts import render
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, mixins, status, filters
+from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
-from .models import File
-from .serializers import FileSerializer
-from .utils import compute_file_hash
-from .filters import FileFilter
+from .models import File, IngestJob, UploadSession
+from .serializers import (
+    BulkDeleteSerializer, FileListSerializer, FileSerializer, HashCheckSerializer, IngestJobSerializer,
+    UploadSessionSerializer,
+)
+from .services import ingest_batch, ingest_upload, reference_existing, release_reference, release_references
+from .upload_sessions import ChunkOffsetError, append_chunk, assemble, discard_state
+from .utils import get_upload_hash, get_upload_hashes
+from .filters import FileFilter, FileSearchFilter
+from .downloads import build_download_response
+from .ingest_jobs import enqueue
+from .cache import current_generation, get_cache, response_key
+from .stats import current_stats, summarize
+from .hash_filter import hash_filter
+from .metrics import allowed_to_scrape, render_metrics
 import logging
 from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 logger = logging.getLogger(__name__)
 
@@ -53,26 +68,110 @@ def root_view(request):
     """
     return HttpResponse(html)
 
-class FileViewSet(viewsets.ModelViewSet):
-    queryset = File.objects.all()
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for the networks in FILES_METRICS['ALLOW_FROM'] only"""
+    if not allowed_to_scrape(request):
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+class FileIngestMixin:
+    """Shared response for every path that ends in ``services.ingest_upload``"""
+
+    def ingest_result(self, instance, created):
+        """Response body and status for an ingested file"""
+        serializer = FileSerializer(instance, context=self.get_serializer_context())
+        if not created:
+            return {
+                "message": "File already exists. Reference count incremented.",
+                "file": serializer.data
+            }, status.HTTP_200_OK
+        return serializer.data, status.HTTP_201_CREATED
+
+    def ingest_response(self, instance, created):
+        data, status_code = self.ingest_result(instance, created)
+        headers = self.get_success_headers(data) if created else None
+        return Response(data, status=status_code, headers=headers)
+
+
+class CachedResponseMixin:
+    """Serve read responses from the files cache, with ETag revalidation.
+
+    Entries are keyed on the cache generation, which every File mutation
+    replaces, so a cached page is only served while nothing has changed.
+    """
+
+    @staticmethod
+    def cache_key_and_etag(request, scope):
+        key = response_key(current_generation(), scope, request.build_absolute_uri('/'), request.query_params)
+        return key, f'W/"{key.rsplit(":", 1)[-1][:32]}"'
+
+    @staticmethod
+    def not_modified(request, etag):
+        # No Last-Modified: it has one-second resolution, so If-Modified-Since could
+        # match across two changes within the same second and return a stale 304
+        return get_conditional_response(request, etag=etag)
+
+    @staticmethod
+    def add_validators(response, etag):
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            # Let clients keep the body but revalidate it on every poll
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def cached_response(self, request, scope, build):
+        key, etag = self.cache_key_and_etag(request, scope)
+        response = self.not_modified(request, etag)
+        if response is None:
+            cache = get_cache()
+            cached = cache.get(key)
+            if cached is not None:
+                response = Response(cached)
+            else:
+                response = build()
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(key, response.data)
+        return self.add_validators(response, etag)
+
+
+class FileViewSet(CachedResponseMixin, FileIngestMixin, viewsets.ModelViewSet):
+    # Join the original file for references so a page costs one query, and
+    # only load the parent columns FileSerializer and downloads actually use
+    queryset = File.objects.select_related('original_file').only(
+        'id', 'file', 'original_filename', 'file_type', 'size', 'uploaded_at',
+        'hash', 'reference_count', 'is_reference', 'original_file', 'is_chunked', 'codec', 'stored_size',
+        'original_file__id', 'original_file__file', 'original_file__original_filename',
+        'original_file__file_type', 'original_file__size', 'original_file__uploaded_at',
+        'original_file__hash', 'original_file__reference_count', 'original_file__is_chunked',
+        'original_file__codec', 'original_file__stored_size',
+    )
     serializer_class = FileSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FileSearchFilter, filters.OrderingFilter]
     filterset_class = FileFilter
     search_fields = ['original_filename', 'file_type']
     ordering_fields = ['uploaded_at', 'size', 'reference_count', 'original_filename']
-    ordering = ['-uploaded_at']  # Default ordering
+    ordering = ['-uploaded_at', '-id']  # Default ordering, matching the (uploaded_at, id) index
 
     def list(self, request, *args, **kwargs):
         logger.info(f"Received filter parameters: {request.query_params}")
-        queryset = self.filter_queryset(self.get_queryset())
-        logger.info(f"Filtered queryset count: {queryset.count()}")
+        return self.cached_response(request, 'list', self.build_list_response)
+
+    def build_list_response(self):
+        # Listings are read-only, so rows are fetched as dicts and serialized by the fast path
+        queryset = self.filter_queryset(self.get_queryset()).values(*FileListSerializer.values)
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
+            serializer = FileListSerializer(page, context=self.get_serializer_context())
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = FileListSerializer(queryset, context=self.get_serializer_context())
         return Response(serializer.data)
 
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            return super(FileViewSet, self).retrieve(request, *args, **kwargs)
+        return self.cached_response(request, f"retrieve:{kwargs['pk']}", build)
+
     def create(self, request, *args, **kwargs):
         try:
             logger.info(f"Received file upload request: {request.data}")
@@ -83,37 +182,15 @@ class FileViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Compute hash of the uploaded file
-            file_hash = compute_file_hash(file_obj)
+            # The upload handlers hash the bytes while they are received,
+            # so this only falls back to reading the file if they were bypassed
+            file_hash = get_upload_hash(file_obj)
             logger.info(f"Computed hash: {file_hash}")
             
-            # Check if file with this hash already exists
-            existing_file = File.objects.filter(hash=file_hash, is_reference=False).first()
-            if existing_file:
-                # Increment reference count and save
-                existing_file.reference_count += 1
-                existing_file.save()
-                logger.info(f"Incremented reference count for file with hash {file_hash}")
-                serializer = self.get_serializer(existing_file)
-                return Response({
-                    "message": "File already exists. Reference count incremented.",
-                    "file": serializer.data
-                }, status=status.HTTP_200_OK)
-
-            # If no existing file, proceed with normal upload
-            data = {
-                'file': file_obj,
-                'original_filename': file_obj.name,
-                'file_type': file_obj.content_type,
-                'size': file_obj.size,
-                'hash': file_hash,
-                'is_reference': False
-            }
-            serializer = self.get_serializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+            instance, created = ingest_upload(
+                file_obj, file_hash, file_obj.name, file_obj.content_type, file_obj.size
+            )
+            return self.ingest_response(instance, created)
 
         except Exception as e:
             logger.error(f"Error in create: {str(e)}", exc_info=True)
@@ -122,30 +199,221 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Upload many files in one request; each gets the status and body POST /files/ would return"""
+        try:
+            file_objs = request.FILES.getlist('files')
+            if not file_objs:
+                return Response(
+                    {"error": "No files were submitted"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            logger.info(f"Received batch upload of {len(file_objs)} files")
+            file_hashes = get_upload_hashes(file_objs)
+            results = []
+            for file_obj, (instance, created, error) in zip(file_objs, ingest_batch(file_objs, file_hashes)):
+                if error:
+                    data, status_code = {"error": error}, status.HTTP_400_BAD_REQUEST
+                else:
+                    data, status_code = self.ingest_result(instance, created)
+                results.append({"filename": file_obj.name, "status": status_code, "response": data})
+            return Response({"results": results}, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            logger.error(f"Error in batch: {str(e)}", exc_info=True)
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    @action(detail=False, methods=['post'])
+    def check(self, request):
+        """Reference an already stored file by hash and size, so duplicates skip the byte transfer"""
+        serializer = HashCheckSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file_hash = serializer.validated_data['hash']
+        existing_file = reference_existing(file_hash, size=serializer.validated_data['size'])
+        if existing_file is None:
+            logger.info(f"No stored file for hash {file_hash}, client must upload")
+            return Response({"exists": False}, status=status.HTTP_404_NOT_FOUND)
+        return self.ingest_response(existing_file, created=False)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Serve the file's bytes with Range, ETag and If-None-Match support"""
+        instance = self.get_object()
+        return build_download_response(request, instance)
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Release one reference from each file listed in ``ids`` or matched by the list filters"""
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            file_ids = serializer.validated_data.get('ids')
+            if file_ids is None:
+                # Empty filters are ignored by django-filter, so only non-empty values count
+                filterset = self.filterset_class(request.query_params, queryset=self.get_queryset(), request=request)
+                if not filterset.is_valid():
+                    return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+                filtered = any(value not in (None, '') for value in filterset.form.cleaned_data.values())
+                if not filtered and not FileSearchFilter().get_search_terms(request):
+                    return Response(
+                        {"error": "Provide ids or at least one filter"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                file_ids = list(self.filter_queryset(self.get_queryset()).values_list('pk', flat=True))
+                if file_ids and len(file_ids) == self.get_queryset().count():
+                    return Response(
+                        {"error": "The filters match every file; list the ids to delete them all"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+            logger.info(f"Bulk delete of {len(file_ids)} files")
+            deleted, decremented = release_references(file_ids)
+            return Response(
+                {"deleted": deleted, "decremented": decremented},
+                status=status.HTTP_200_OK
+            )
+
+        except Exception as e:
+            logger.error(f"Error in bulk_delete: {str(e)}", exc_info=True)
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
     def destroy(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
             logger.info(f"Deleting file: {instance.id}, reference_count: {instance.reference_count}")
             
-            # If reference_count > 1, just decrement the count
-            if instance.reference_count > 1:
-                logger.info(f"Decrementing reference count from {instance.reference_count}")
-                instance.reference_count -= 1
-                instance.save()
-                logger.info(f"New reference count: {instance.reference_count}")
+            # Decrement in the database; the row is only deleted when this was the last reference
+            deleted, reference_count = release_reference(instance.pk)
+            if not deleted:
+                logger.info(f"New reference count: {reference_count}")
                 return Response(
                     {"message": "Reference count decremented"}, 
                     status=status.HTTP_200_OK
                 )
-            else:
-                # If reference_count is 1, delete the file completely
-                logger.info("Deleting file as it has no more references")
-                self.perform_destroy(instance)
-                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(status=status.HTTP_204_NO_CONTENT)
                 
         except Exception as e:
             logger.error(f"Error in destroy: {str(e)}", exc_info=True)
             return Response(
                 {"error": str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+
+class UploadSessionViewSet(FileIngestMixin,
+                           mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """Resumable uploads: create a session, PUT chunks by offset, then finalize"""
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', session.received))
+            # Read the raw body straight from the stream; request.data would buffer it
+            received = append_chunk(session, offset, request.stream)
+            logger.info(f"Upload session {session.id} received {received}/{session.size} bytes")
+            return Response(self.get_serializer(session).data, status=status.HTTP_200_OK)
+        except ChunkOffsetError as e:
+            return Response(
+                {"error": str(e), "received": e.expected},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValueError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        try:
+            if not session.is_complete:
+                return Response(
+                    {"error": f"Upload incomplete: received {session.received} of {session.size} bytes"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Closing removes the staged bytes unless storage already moved them, also on failure
+            with assemble(session) as staged:
+                logger.info(f"Finalizing upload session {session.id} with hash {staged.sha256}")
+                instance, created = ingest_upload(
+                    staged, staged.sha256, session.original_filename, session.file_type, session.size
+                )
+            session.delete()
+            return self.ingest_response(instance, created)
+
+        except Exception as e:
+            logger.error(f"Error in finalize: {str(e)}", exc_info=True)
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def perform_destroy(self, instance):
+        discard_state(instance, remove_staged=True)
+        instance.delete()
+
+
+class IngestJobViewSet(FileIngestMixin,
+                       mixins.CreateModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """Queued uploads: POST stages the bytes and returns 202, a worker pool stores them"""
+    queryset = IngestJob.objects.select_related('file')
+    serializer_class = IngestJobSerializer
+
+    def create(self, request, *args, **kwargs):
+        try:
+            file_obj = request.data.get('file')
+            if not file_obj:
+                return Response(
+                    {"error": "No file was submitted"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            job = enqueue(file_obj)
+            logger.info(f"Queued ingest job {job.id} for {job.original_filename}")
+            location = request.build_absolute_uri(reverse('ingestjob-detail', args=[job.pk]))
+            return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+        except Exception as e:
+            logger.error(f"Error in ingest create: {str(e)}", exc_info=True)
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        data = self.get_serializer(job).data
+        if job.status == IngestJob.DONE and job.file is not None:
+            # What POST /api/files/ would have answered for this upload
+            body, status_code = self.ingest_result(job.file, job.created)
+            data['result'] = {"status": status_code, "response": body}
+        return Response(data)
+
+
+class StatsViewSet(viewsets.ViewSet):
+    """Storage and dedup totals, read from the per-type summary table"""
+
+    def list(self, request):
+        return Response(summarize(current_stats()))
+
+    @action(detail=False, methods=['get'], url_path='hash-filter')
+    def hash_filter(self, request):
+        """Size and hit/miss counters of the dedup hash filter in the worker that serves the request"""
+        return Response(hash_filter.stats())
@@ -185,7 +185,7 @@ export const FileList: React.FC = () => {
                     </div>
                     <div className="flex space-x-2">
                       <button
-                        onClick={() => handleDownload(file.file, file.original_filename)}
+                        onClick={() => handleDownload(fileService.getDownloadUrl(file.id), file.original_filename)}
                         disabled={downloadMutation.isPending}
                         className="inline-flex items-center px-3 py-2 border border-transparent shadow-sm text-sm leading-4 font-medium rounded-md text-white bg-primary-600 hover:bg-primary-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-primary-500"
                       >
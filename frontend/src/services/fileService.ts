@@ -15,8 +15,47 @@ interface FileFilters {
   maxReferenceCount?: number;
 }
 
+// Hashing needs the whole file in memory, so larger files skip the pre-upload check
+const MAX_CLIENT_HASH_SIZE = 512 * 1024 * 1024;
+
+async function computeSha256(file: File): Promise<string | null> {
+  // crypto.subtle is only available in secure contexts (https or localhost)
+  if (!window.crypto?.subtle || file.size > MAX_CLIENT_HASH_SIZE) {
+    return null;
+  }
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, '0'))
+    .join('');
+}
+
 export const fileService = {
+  // Returns the stored file's record if the server already has this content,
+  // in which case its reference count has been incremented and no upload is needed
+  async checkExisting(file: File): Promise<FileType | null> {
+    const hash = await computeSha256(file);
+    if (!hash) {
+      return null;
+    }
+    try {
+      const response = await axios.post(`${API_URL}/files/check/`, { hash, size: file.size });
+      return response.data;
+    } catch (error) {
+      if (axios.isAxiosError(error) && error.response?.status === 404) {
+        return null;
+      }
+      // The check is only an optimization; fall back to a normal upload
+      console.error('Hash check error:', error);
+      return null;
+    }
+  },
+
   async uploadFile(file: File): Promise<FileType> {
+    const existing = await fileService.checkExisting(file);
+    if (existing) {
+      return existing;
+    }
+
     try {
       const formData = new FormData();
       formData.append('file', file);
@@ -94,6 +133,11 @@ export const fileService = {
     }
   },
 
+  // Served by the API in every deployment, unlike the debug-only /media/ URLs
+  getDownloadUrl(id: string): string {
+    return `${API_URL}/files/${id}/download/`;
+  },
+
   async downloadFile(fileUrl: string, filename: string): Promise<void> {
     try {
       const response = await axios.get(fileUrl, {